@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+#
+#     Copyright 2018 Ibai Roman
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Which pairs of lighthouses a connection may join
+
+The lighthouses and the current connections are kept in the engine's
+SegmentIndex, so a pair is only tested against the connections and
+lighthouses near it. Connections change a little from turn to turn:
+update() only adds and removes those that appeared or disappeared since
+its previous call, and the answers are kept until they do.
+"""
+
+from ironlib.geometry import SegmentIndex
+
+
+def pair(a, b):
+    """
+    The same key for the pair (a, b) and (b, a)
+
+    :param a:
+    :param b:
+    :return:
+    """
+    return (a, b) if a < b else (b, a)
+
+
+class ConnectionCache(object):
+    """
+    Connection state of the lighthouse pairs, kept between turns
+    """
+
+    def __init__(self, lighthouses):
+        """
+
+        :param lighthouses: (x, y) positions
+        """
+        self.lighthouses = [tuple(lh) for lh in lighthouses]
+        self.index = SegmentIndex()
+        for lh in self.lighthouses:
+            self.index.add_point(lh)
+        self.connections = set()
+        self.__blocked = {}
+        self.__lh_between = {}
+
+    def update(self, lh_states):
+        """
+        Take the connections of a new turn
+
+        :param lh_states: lighthouse states from the engine, by position
+        :return:
+        """
+        current = set()
+        for lh in lh_states:
+            for dest in lh_states[lh]["connections"]:
+                current.add(pair(tuple(lh), tuple(dest)))
+
+        gone = self.connections - current
+        new = current - self.connections
+        for conn in gone:
+            self.index.remove(*conn)
+        for conn in new:
+            self.index.add(*conn)
+        if gone or new:
+            self.__blocked = {}
+        self.connections = current
+
+    def connected(self, a, b):
+        """
+        Whether a and b are connected
+
+        :param a:
+        :param b:
+        :return:
+        """
+        return pair(a, b) in self.connections
+
+    def blocked(self, a, b):
+        """
+        Whether a lighthouse lies between a and b or a connection crosses
+        the segment ab
+
+        :param a:
+        :param b:
+        :return:
+        """
+        p = pair(a, b)
+        if p not in self.__blocked:
+            self.__blocked[p] = (self.lh_between(*p) or
+                                 self.index.crosses(*p))
+        return self.__blocked[p]
+
+    def lh_between(self, a, b):
+        """
+        Whether a lighthouse other than a and b lies on the segment ab
+
+        :param a:
+        :param b:
+        :return:
+        """
+        p = pair(a, b)
+        if p not in self.__lh_between:
+            self.__lh_between[p] = self.index.hits_point(*p)
+        return self.__lh_between[p]
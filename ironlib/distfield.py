@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+#     Copyright 2018 Ibai Roman
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Walking distances from the lighthouses to every cell of the island
+
+All lighthouses are expanded together, one step per iteration, by dilating
+a boolean frontier of shape (L, H, W) with the 8 moves and masking it with
+the island, so the work per step is a few NumPy operations whatever the
+number of lighthouses.
+"""
+
+import numpy as np
+
+
+def dist_fields(world_map, sources, unreachable):
+    """
+    Distance maps of all sources, as one (L, H, W) array indexed [l, y, x]
+
+    :param world_map: rows of the map, truthy where a player can walk
+    :param sources: (x, y) positions, one per map
+    :param unreachable: value of the cells no source can reach; also sets
+        the dtype of the result
+    :return:
+    """
+    island = np.asarray(world_map, dtype=bool)
+    h, w = island.shape
+    n = len(sources)
+    dist = np.empty((n, h, w), dtype=np.asarray(unreachable).dtype)
+    dist.fill(unreachable)
+    if not n:
+        return dist
+
+    xs, ys = np.asarray(sources, dtype=int).T
+    frontier = np.zeros((n, h, w), dtype=bool)
+    frontier[np.arange(n), ys, xs] = True
+    unseen = island[None].repeat(n, axis=0)
+    unseen &= ~frontier
+    grown = np.empty_like(frontier)
+    step = 0
+    while frontier.any():
+        dist[frontier] = step
+        # The 8-neighbourhood is a 3x3 square: dilate along x, then y.
+        grown[:] = frontier
+        grown[:, :, 1:] |= frontier[:, :, :-1]
+        grown[:, :, :-1] |= frontier[:, :, 1:]
+        frontier[:] = grown
+        frontier[:, 1:] |= grown[:, :-1]
+        frontier[:, :-1] |= grown[:, 1:]
+        frontier &= unseen
+        unseen &= ~frontier
+        step += 1
+    return dist
+
+
+def pair_dists(fields, sources):
+    """
+    Walking distance between every pair of sources, as an (L, L) array
+
+    :param fields: result of dist_fields for sources
+    :param sources: (x, y) positions
+    :return: array whose [i, j] is the distance from sources[i] to sources[j]
+    """
+    if not len(sources):
+        return fields[:, :0, 0]
+    xs, ys = np.asarray(sources, dtype=int).T
+    return fields[:, ys, xs]
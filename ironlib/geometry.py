@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+#
+#     Copyright 2018 Ibai Roman
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""
+Geometry shared by the engine and the bots
+
+The engine's geom module imports these functions, so the bots test
+crossings and count triangle cells exactly as the engine does when it
+accepts a connection and scores a triangle.
+Only the standard library is used.
+"""
+
+
+def orient2d(a, b, c):
+    """
+
+    :param a:
+    :param b:
+    :param c:
+    :return:
+    """
+    return (b[0] - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (b[1] - a[1])
+
+
+def colinear(a, b, c):
+    """
+
+    :param a:
+    :param b:
+    :param c:
+    :return:
+    """
+    return orient2d(a, b, c) == 0
+
+
+def intersect(j, k):
+    """
+    Whether segments j and k cross at a point inside both
+
+    :param j:
+    :param k:
+    :return:
+    """
+    j1, j2 = j
+    k1, k2 = k
+    return (orient2d(k1, k2, j1) * orient2d(k1, k2, j2) < 0 and
+            orient2d(j1, j2, k1) * orient2d(j1, j2, k2) < 0)
+
+
+class SegmentIndex(object):
+    """
+    Uniform grid of buckets over segments and points with integer
+    coordinates
+
+    A segment is stored in every bucket it touches, so a query only tests
+    the segments and points sharing a bucket with it instead of all of them.
+    """
+    CELL = 4
+
+    def __init__(self, cell=CELL):
+        """
+
+        :param cell: side of a bucket
+        """
+        self.cell = cell
+        self._segs = {}
+        self._points = {}
+        self._where = {}
+
+    def _buckets(self, a, b):
+        """
+
+        :param a:
+        :param b:
+        :return:
+        """
+        c = self.cell
+        (x0, y0), (x1, y1) = sorted((a, b))
+        if x0 == x1:
+            y0, y1 = sorted((y0, y1))
+            for by in xrange(y0 // c, y1 // c + 1):
+                yield x0 // c, by
+            return
+        # For each column of buckets, the y range covered by the part of
+        # the segment inside it (closed at both ends). Exact integer
+        # arithmetic: y(x) = (y0 * dx + dy * (x - x0)) / dx.
+        dx, dy = x1 - x0, y1 - y0
+        for bx in xrange(x0 // c, x1 // c + 1):
+            lo = max(x0, bx * c)
+            hi = min(x1, bx * c + c)
+            ya = y0 * dx + dy * (lo - x0)
+            yb = y0 * dx + dy * (hi - x0)
+            if ya > yb:
+                ya, yb = yb, ya
+            for by in xrange(ya // (dx * c), yb // (dx * c) + 1):
+                yield bx, by
+
+    def add_point(self, p):
+        """
+
+        :param p:
+        :return:
+        """
+        key = p[0] // self.cell, p[1] // self.cell
+        self._points.setdefault(key, set()).add(p)
+
+    def add(self, a, b):
+        """
+
+        :param a:
+        :param b:
+        :return:
+        """
+        seg = frozenset((a, b))
+        where = list(self._buckets(a, b))
+        self._where[seg] = where
+        for key in where:
+            self._segs.setdefault(key, set()).add(seg)
+
+    def remove(self, a, b):
+        """
+
+        :param a:
+        :param b:
+        :return:
+        """
+        seg = frozenset((a, b))
+        for key in self._where.pop(seg):
+            bucket = self._segs[key]
+            bucket.discard(seg)
+            if not bucket:
+                del self._segs[key]
+
+    def crosses(self, a, b):
+        """
+        Whether segment ab properly intersects any stored segment
+
+        :param a:
+        :param b:
+        :return:
+        """
+        seen = set()
+        for key in self._buckets(a, b):
+            for seg in self._segs.get(key, ()):
+                if seg not in seen:
+                    seen.add(seg)
+                    if intersect(tuple(seg), (a, b)):
+                        return True
+        return False
+
+    def hits_point(self, a, b):
+        """
+        Whether segment ab passes through a stored point other than a, b
+
+        :param a:
+        :param b:
+        :return:
+        """
+        x0, x1 = sorted((a[0], b[0]))
+        y0, y1 = sorted((a[1], b[1]))
+        for key in self._buckets(a, b):
+            for p in self._points.get(key, ()):
+                if (x0 <= p[0] <= x1 and y0 <= p[1] <= y1 and
+                        p not in (a, b) and colinear(a, b, p)):
+                    return True
+        return False
+
+
+def _bias(p0, p1):
+    """
+
+    :param p0:
+    :param p1:
+    :return:
+    """
+    if (p0[1] == p1[1] and p0[0] > p1[0]) or p0[1] > p1[1]:
+        return 0
+    else:
+        return -1
+
+
+def render_spans(points):
+    """
+    Cells covered by a triangle as (y, x0, x1) row spans, bottom to top
+
+    Same coverage rule as testing the three biased edge functions at every
+    cell, but each edge is solved for its x bound once per row.
+
+    :param points: the three corners
+    :return:
+    """
+    v0, v1, v2 = points
+    if orient2d(v0, v1, v2) < 0:
+        v0, v1 = v1, v0
+    x0 = min(v0[0], v1[0], v2[0])
+    x1 = max(v0[0], v1[0], v2[0])
+    y0 = min(v0[1], v1[1], v2[1])
+    y1 = max(v0[1], v1[1], v2[1])
+    # orient2d(a, b, p) + _bias(a, b) == A * p.x + B * p.y + C
+    edges = [(a[1] - b[1], b[0] - a[0],
+              (b[1] - a[1]) * a[0] - (b[0] - a[0]) * a[1] + _bias(a, b))
+             for a, b in ((v1, v2), (v2, v0), (v0, v1))]
+    for y in xrange(y0, y1 + 1):
+        lo, hi = x0, x1
+        for a, b, c in edges:
+            k = b * y + c
+            if a > 0:
+                lo = max(lo, -(k // a))
+            elif a < 0:
+                hi = min(hi, k // -a)
+            elif k < 0:
+                hi = lo - 1
+        if lo <= hi:
+            yield y, lo, hi
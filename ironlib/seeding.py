@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+#     Copyright 2018 Ibai Roman
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""
+Seeding from the match
+
+The tournament runner gives every match a seed in the LIGHTHOUSES_SEED
+environment variable, so that a match can be replayed with the same
+random choices. The engine imports SEED_VAR and seed() from here, so
+both sides agree on the variable. numpy is optional, as in the engine.
+"""
+
+import os
+import random
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SEED_VAR = "LIGHTHOUSES_SEED"
+
+
+def seed(value):
+    """
+    Seed random, and numpy when it is installed
+
+    :param value:
+    :return:
+    """
+    random.seed(value)
+    if np is not None:
+        np.random.seed(value)
+
+
+def seed_from_env(default=None):
+    """
+    Seed random and numpy with the match seed
+
+    :param default: seed to use when the variable is not set, None to
+        leave the generators alone
+    :return: the seed used, or None
+    """
+    value = os.environ.get(SEED_VAR)
+    if value is None:
+        value = default
+    if value is None:
+        return None
+    value = int(value)
+    seed(value)
+    return value
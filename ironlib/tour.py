@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+#
+#     Copyright 2018 Ibai Roman
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Short lighthouse tours, planned by beam search
+
+A tour is a sequence of lighthouses to walk to. On arrival the player
+captures the lighthouse if it is not ours, picks up its key and connects
+it to every lighthouse we own and hold the key of, closing the triangles
+those connections complete. A tour is worth the score those gains add
+over the next `horizon` rounds, so the sooner a gain comes the more it is
+worth.
+
+Walking times come from the distance fields of ironlib.distfield. Whether
+two lighthouses can be connected is asked of the caller for the current
+board, so connections planned inside the same tour are not checked
+against each other.
+
+plan() can be given a deadline: it then stops expanding tours when the
+time is up and returns the best tour found so far.
+"""
+
+import time
+
+from ironlib import distfield
+
+HORIZON = 100   # rounds over which a score rate is counted
+DEPTH = 3       # lighthouses per tour
+WIDTH = 16      # partial tours kept at each depth
+
+
+class TourPlanner(object):
+    """
+    Tours over the lighthouses of one map
+    """
+
+    def __init__(self, lighthouses, fields):
+        """
+
+        :param lighthouses: (x, y) positions
+        :param fields: distfield.dist_fields of lighthouses
+        """
+        self.lighthouses = [tuple(lh) for lh in lighthouses]
+        self.index = dict((lh, i) for i, lh in enumerate(self.lighthouses))
+        self.fields = fields
+        self.dist = distfield.pair_dists(fields, self.lighthouses).tolist()
+
+    def plan(self, pos, owned, keys, connections, can_connect, tri_value,
+             candidates=None, depth=DEPTH, width=WIDTH, horizon=HORIZON,
+             deadline=None):
+        """
+        Best tour of at most depth lighthouses starting from pos
+
+        :param pos: (x, y) of the player
+        :param owned: lighthouses we own
+        :param keys: lighthouses we hold the key of
+        :param connections: our connections, as pairs of lighthouses
+        :param can_connect: can_connect(a, b), whether a and b can be
+            connected on the current board
+        :param tri_value: tri_value(a, b, c), score per round of the
+            triangle abc
+        :param candidates: lighthouses the tour may visit (default: all)
+        :param depth:
+        :param width:
+        :param horizon:
+        :param deadline: time.time() at which to stop searching
+        :return: (value, tour), tour being a list of lighthouses; the
+            empty tour, worth 0, when no tour gains anything
+        """
+        index = self.index
+        lighthouses = self.lighthouses
+        if candidates is None:
+            candidates = lighthouses
+        cands = [index[lh] for lh in candidates]
+        edges = frozenset(self.__pair(index[a], index[b])
+                          for a, b in connections)
+        start_dist = self.fields[:, pos[1], pos[0]].tolist()
+
+        connectable = {}
+        tri_values = {}
+
+        def can(i, j):
+            pair = self.__pair(i, j)
+            if pair not in connectable:
+                connectable[pair] = can_connect(lighthouses[i], lighthouses[j])
+            return connectable[pair]
+
+        def tri(i, j, k):
+            key = tuple(sorted((i, j, k)))
+            if key not in tri_values:
+                tri_values[key] = tri_value(*[lighthouses[n] for n in key])
+            return tri_values[key]
+
+        beam = [(0.0, 0, -1, (),
+                 frozenset(index[lh] for lh in owned),
+                 frozenset(index[lh] for lh in keys),
+                 edges)]
+        best = (0.0, ())
+        timeout = False
+        for _ in range(depth):
+            children = []
+            for value, t, last, tour, own, key, edge in beam:
+                row = start_dist if last < 0 else self.dist[last]
+                for c in cands:
+                    if deadline is not None and time.time() > deadline:
+                        timeout = True
+                        break
+                    arrival = t + row[c]
+                    if c in tour or arrival >= horizon:
+                        continue
+                    gain = 0
+                    c_own, c_key, c_edge = own, key, edge
+                    if c not in c_own:
+                        arrival += 1
+                        gain += 2 * (horizon - arrival)
+                        c_own = c_own | frozenset((c,))
+                    c_key = c_key | frozenset((c,))
+                    for other in own:
+                        pair = self.__pair(c, other)
+                        if (other == c or other not in c_key or
+                                pair in c_edge or not can(c, other)):
+                            continue
+                        arrival += 1
+                        rate = 2
+                        for z in c_own:
+                            if (self.__pair(c, z) in c_edge and
+                                    self.__pair(other, z) in c_edge):
+                                rate += tri(c, other, z)
+                        gain += rate * max(0, horizon - arrival)
+                        c_key = c_key - frozenset((other,))
+                        c_edge = c_edge | frozenset((pair,))
+                    children.append((value + gain, arrival, c, tour + (c,),
+                                     c_own, c_key, c_edge))
+                if timeout:
+                    break
+            if not children:
+                break
+            children.sort(key=lambda node: (-node[0], node[1]))
+            beam = children[:width]
+            if beam[0][0] > best[0]:
+                best = (beam[0][0], beam[0][3])
+            if timeout:
+                break
+        return best[0], [lighthouses[i] for i in best[1]]
+
+    @staticmethod
+    def __pair(i, j):
+        """
+
+        :param i:
+        :param j:
+        :return:
+        """
+        return (i, j) if i < j else (j, i)
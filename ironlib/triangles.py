@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+#
+#     Copyright 2018 Ibai Roman
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Score of lighthouse triangles, and the triangles one connection from closing
+
+A closed triangle scores one point per round for every island cell it
+covers. The cells are those of geometry.render_spans, which the engine
+scores with too, counted on each row with a prefix sum of the island
+mask, once per triangle.
+"""
+
+from ironlib.connections import pair
+from ironlib.geometry import render_spans
+
+
+class TriangleTable(object):
+    """
+    Island cells of every lighthouse triangle, computed on first use
+    """
+
+    def __init__(self, world_map):
+        """
+
+        :param world_map: rows of the map, truthy on the island
+        """
+        self.prefix = []
+        for row in world_map:
+            sums = [0]
+            for cell in row:
+                sums.append(sums[-1] + (1 if cell else 0))
+            self.prefix.append(sums)
+        self.cells = {}
+
+    def value(self, a, b, c):
+        """
+        Points per round of the triangle abc
+
+        :param a:
+        :param b:
+        :param c:
+        :return:
+        """
+        key = tuple(sorted((tuple(a), tuple(b), tuple(c))))
+        if key not in self.cells:
+            prefix = self.prefix
+            self.cells[key] = sum(prefix[y][x1 + 1] - prefix[y][x0]
+                                  for y, x0, x1 in render_spans(key))
+        return self.cells[key]
+
+
+class ClosingIndex(object):
+    """
+    Our triangles that one more connection would close
+
+    For every pair of our lighthouses that is not connected, keeps the
+    lighthouses connected to both of them. update() adjusts it for the
+    connections that appeared or disappeared since its previous call.
+    """
+
+    def __init__(self):
+        self.adj = {}
+        self.closing = {}
+
+    def update(self, connections):
+        """
+        Take our connections of a new turn
+
+        :param connections: pairs of connected lighthouses
+        :return:
+        """
+        current = set(pair(tuple(a), tuple(b)) for a, b in connections)
+        old = set(pair(a, b) for a in self.adj for b in self.adj[a])
+        for a, b in old - current:
+            self.__disconnect(a, b)
+        for a, b in current - old:
+            self.__connect(a, b)
+
+    def thirds(self, a, b):
+        """
+        Lighthouses whose triangle with a and b connecting a-b closes
+
+        :param a:
+        :param b:
+        :return:
+        """
+        return self.closing.get(pair(a, b), ())
+
+    def gain(self, a, b, table):
+        """
+        Score per round that connecting a and b adds
+
+        :param a:
+        :param b:
+        :param table: TriangleTable of the map
+        :return:
+        """
+        return 2 + sum(table.value(a, b, c) for c in self.thirds(a, b))
+
+    def __connect(self, a, b):
+        """
+
+        :param a:
+        :param b:
+        :return:
+        """
+        self.closing.pop(pair(a, b), None)
+        for u, v in ((a, b), (b, a)):
+            for w in self.adj.get(u, ()):
+                if w not in self.adj.get(v, ()):
+                    self.closing.setdefault(pair(v, w), set()).add(u)
+        self.adj.setdefault(a, set()).add(b)
+        self.adj.setdefault(b, set()).add(a)
+
+    def __disconnect(self, a, b):
+        """
+
+        :param a:
+        :param b:
+        :return:
+        """
+        self.adj[a].discard(b)
+        self.adj[b].discard(a)
+        for u, v in ((a, b), (b, a)):
+            for w in self.adj[u]:
+                p = pair(v, w)
+                if p in self.closing:
+                    self.closing[p].discard(u)
+                    if not self.closing[p]:
+                        del self.closing[p]
+        both = self.adj[a] & self.adj[b]
+        if both:
+            self.closing[pair(a, b)] = both
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+
+import sys, os, json, optparse
+import match, multiplex
+
+def run(maps, bots, rounds, vectorized=False, quiet=False, games=1,
+        concurrent=False):
+    stderr = None
+    if quiet:
+        stderr = open(os.devnull, "w")
+    maps = [cfg_file for cfg_file in maps for i in xrange(games)]
+    if concurrent:
+        matches = [match.Match(cfg_file, bots, vectorized=vectorized, stderr=stderr)
+                   for cfg_file in maps]
+        try:
+            multiplex.run_matches(matches, rounds)
+        finally:
+            for m in matches:
+                m.close()
+        return [m.result() for m in matches]
+    results = []
+    for cfg_file in maps:
+        m = match.Match(cfg_file, bots, vectorized=vectorized, stderr=stderr)
+        try:
+            m.run(rounds)
+        finally:
+            m.close()
+        results.append(m.result())
+    return results
+
+def main():
+    parser = optparse.OptionParser(
+        usage="%prog [options] -m <map> [-m <map>...] <bot command>...")
+    parser.add_option("-m", "--map", dest="maps", action="append", default=[],
+                      help="map file to play (may be repeated)")
+    parser.add_option("-r", "--rounds", type="int", default=1000,
+                      help="rounds per game (default: %default)")
+    parser.add_option("-g", "--games", type="int", default=1,
+                      help="games per map (default: %default)")
+    parser.add_option("-c", "--concurrent", action="store_true", default=False,
+                      help="play all games at once from a single event loop")
+    parser.add_option("-o", "--output", default=None,
+                      help="write the score table to this file instead of stdout")
+    parser.add_option("-q", "--quiet", action="store_true", default=False,
+                      help="discard bot stderr output")
+    parser.add_option("--vectorized", action="store_true", default=False,
+                      help="use the NumPy energy field")
+    opts, bots = parser.parse_args()
+    if not opts.maps:
+        parser.error("at least one map is required")
+    if not bots:
+        parser.error("at least one bot is required")
+
+    results = run(opts.maps, bots, opts.rounds, opts.vectorized, opts.quiet,
+                  opts.games, opts.concurrent)
+    table = json.dumps({"rounds": opts.rounds, "games": results}, indent=1)
+    if opts.output is None:
+        print table
+    else:
+        with open(opts.output, "w") as fd:
+            fd.write(table + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+
+# Microbenchmark of the bot pipe protocol: turns per second against an echo
+# bot that answers every state immediately, with the old one-byte-per-read
+# BotPlayer._recv and with the current buffered reader.
+
+import sys, os, json, time, select, optparse
+import engine, botplayer
+
+MAPS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "maps")
+
+def echo_bot(pad):
+    """Bot side: greet, then reply to every state with a padded pass."""
+    move = json.dumps({"command": "pass", "pad": "x" * pad}) + "\n"
+    sys.stdin.readline()
+    sys.stdout.write(json.dumps({"name": "EchoBot"}) + "\n")
+    sys.stdout.flush()
+    while True:
+        if not sys.stdin.readline():
+            break
+        sys.stdout.write(move)
+        sys.stdout.flush()
+        sys.stdin.readline()
+
+class ByteReaderPlayer(botplayer.BotPlayer):
+    """BotPlayer with the original select + read(1) loop."""
+    def readline(self):
+        line = ""
+        try:
+            while not line or line[-1] != "\n":
+                r,w,e = select.select([self.p.stdout],[],[],self.deadline - time.time())
+                if self.p.stdout not in r:
+                    raise botplayer.CommError("Bot %r over hard timeout" % self.player.name)
+                line += self.p.stdout.read(1)
+        except Exception as e:
+            raise botplayer.CommError("Unknown error: %r" % e)
+        return line
+
+def bench(cls, cfg, turns, pad):
+    game = engine.Game(cfg, 1)
+    cmdline = "%s %s --echo %d" % (sys.executable, os.path.abspath(__file__), pad)
+    actor = cls(game, 0, cmdline)
+    actor.initialize()
+    st = time.time()
+    for i in xrange(turns):
+        actor.turn()
+    elapsed = time.time() - st
+    actor.close()
+    return turns / elapsed
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("-m", "--map", default=os.path.join(MAPS_DIR, "square.txt"))
+    parser.add_option("-t", "--turns", type="int", default=2000)
+    parser.add_option("-p", "--pad", type="int", action="append", default=[],
+                      help="reply padding in bytes (default: 0 and 4096)")
+    parser.add_option("--echo", type="int", default=None, help=optparse.SUPPRESS_HELP)
+    opts, args = parser.parse_args()
+    if opts.echo is not None:
+        echo_bot(opts.echo)
+        return
+
+    cfg = engine.GameConfig(opts.map)
+    for pad in opts.pad or [0, 4096]:
+        before = bench(ByteReaderPlayer, cfg, opts.turns, pad)
+        after = bench(botplayer.BotPlayer, cfg, opts.turns, pad)
+        print "reply pad %5d bytes: read(1) %8.1f turns/s, buffered %8.1f turns/s (x%.1f)" % (
+            pad, before, after, after / before)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 #!/usr/bin/python
 
-import json, subprocess, time, select, sys
+import json, subprocess, time, select, sys, os, imp, inspect
 import engine
 
 class CommError(Exception):
@@ -10,12 +10,19 @@ class BotPlayer(object):
     INIT_TIMEOUT = 2.0
     MOVE_TIMEOUT = 0.1
     MOVE_HARDTIMEOUT = 0.5
-    def __init__(self, game, playernum, cmdline, debug=False):
+    KILL_GRACE = 1.0
+    READ_SIZE = 65536
+    def __init__(self, game, playernum, cmdline, debug=False, stderr=None, env=None):
         self.alive = True
-        self.p = subprocess.Popen(cmdline, stdin=subprocess.PIPE, stdout=subprocess.PIPE, shell=True)
+        self.p = subprocess.Popen(cmdline, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                  stderr=stderr, env=env, shell=True)
+        self._fd = self.p.stdout.fileno()
+        self._rbuf = ""
         self.game = game
         self.player = game.players[playernum]
         self.debug = debug
+        # Move and status of the last turn, None if no move was executed.
+        self.last_move = self.last_status = None
 
     def _send(self, data):
         line = json.dumps(data)
@@ -28,20 +35,38 @@ class BotPlayer(object):
         except:
             raise CommError("Error sending data")
 
-    def _recv(self, soft_timeout, hard_timeout):
-        st = time.time()
-        et = time.time() + soft_timeout
-        ht = time.time() + hard_timeout
-        line = ""
-        try:
-            while not line or line[-1] != "\n":
-                r,w,e = select.select([self.p.stdout],[],[],ht - time.time())
-                if self.p.stdout not in r:
-                    raise CommError("Bot %r over hard timeout" % self.player.name)
-                line += self.p.stdout.read(1)
-        except Exception as e:
-            raise CommError("Unknown error: %r" % e)
-        if time.time() > et:
+    def _take_line(self):
+        end = self._rbuf.find("\n")
+        if end < 0:
+            return None
+        line = self._rbuf[:end+1]
+        self._rbuf = self._rbuf[end+1:]
+        return line
+
+    def _fill(self):
+        data = os.read(self._fd, self.READ_SIZE)
+        if not data:
+            raise CommError("Bot %r closed its output" % self.player.name)
+        self._rbuf += data
+
+    def _readline(self, deadline):
+        # Read whatever the bot has written so far in large chunks and keep
+        # any bytes past the first newline for the next call.
+        line = self._take_line()
+        while line is None:
+            r,w,e = select.select([self._fd],[],[],max(0, deadline - time.time()))
+            if not r:
+                raise CommError("Bot %r over hard timeout" % self.player.name)
+            self._fill()
+            line = self._take_line()
+        return line
+
+    def _wait(self, soft_timeout, hard_timeout):
+        self._soft_deadline = time.time() + soft_timeout
+        self.deadline = time.time() + hard_timeout
+
+    def _decode(self, line):
+        if time.time() > self._soft_deadline:
             sys.stderr.write("Bot %r over soft timeout\n" % self.player.name)
         try:
             if self.debug:
@@ -50,45 +75,64 @@ class BotPlayer(object):
         except Exception as e:
             raise CommError("Invalid JSON: %r" % e)
 
-    def initialize(self):
-        if not self.alive:
-            return
-        self._send({
+    def readline(self):
+        """Block until the pending reply arrives or the hard timeout."""
+        try:
+            return self._readline(self.deadline)
+        except CommError:
+            raise
+        except Exception as e:
+            raise CommError("Unknown error: %r" % e)
+
+    def fileno(self):
+        return self._fd
+
+    def poll(self):
+        """Non-blocking: read what is available and return the pending
+        reply line, or None if it is not complete yet."""
+        try:
+            line = self._take_line()
+            if line is None and select.select([self._fd],[],[],0)[0]:
+                self._fill()
+                line = self._take_line()
+            return line
+        except CommError:
+            raise
+        except Exception as e:
+            raise CommError("Unknown error: %r" % e)
+
+    def _init_state(self):
+        return {
             "player_num": self.player.num,
             "player_count": len(self.game.players),
-            "position": self.player.pos,
+            "position": list(self.player.pos),
             "map": self.game.island.map,
-            "lighthouses": self.game.lighthouses.keys(),
-        })
-        reply = self._recv(self.INIT_TIMEOUT, self.INIT_TIMEOUT)
-        if not (isinstance(reply, dict) and
-                "name" in reply and
-                isinstance(reply["name"], basestring)):
-            raise CommError("Bot did not greet with name")
-        self.player.name = reply["name"]
+            "lighthouses": [list(pos) for pos in self.game.lighthouses],
+            "move_timeout": self.MOVE_TIMEOUT,
+        }
 
-    def turn(self):
-        if not self.alive:
-            return
+    def _turn_state(self):
+        # Built from lists only, so in-process bots see the same structures
+        # that a subprocess bot gets back from json.loads.
         lighthouses = []
         for lh in self.game.lighthouses.itervalues():
-            connections = [(l for l in c if l is not lh.pos).next()
-                            for c in self.game.conns if lh.pos in c]
+            connections = [list(l) for l in self.game.lh_conns[lh.pos]]
             lighthouses.append({
-                "position": lh.pos,
+                "position": list(lh.pos),
                 "owner": lh.owner,
                 "energy": lh.energy,
                 "connections": connections,
                 "have_key": lh.pos in self.player.keys,
             })
-        self._send({
-            "position": self.player.pos,
+        return {
+            "position": list(self.player.pos),
             "score": self.player.score,
             "energy": self.player.energy,
             "view": self.game.island.get_view(self.player.pos),
             "lighthouses": lighthouses,
-        })
-        move = self._recv(self.MOVE_TIMEOUT, self.MOVE_HARDTIMEOUT)
+        }
+
+    def _execute(self, move):
         if not isinstance(move, dict) or "command" not in move:
             raise CommError("Invalid command structure")
         try:
@@ -115,14 +159,59 @@ class BotPlayer(object):
                 self.game.connect(self.player, dest)
             else:
                 raise engine.MoveError("Invalid command %r" % move["command"])
-            self._send({"success": True})
+            return {"success": True}
         except engine.MoveError as e:
             #sys.stderr.write("Bot %r move error: %s\n" % (self.player.name, e.message))
-            self._send({"success": False, "message": e.message})
+            return {"success": False, "message": e.message}
+
+    # initialize() and turn() are split in begin/end halves so that an event
+    # loop (see multiplex.py) can wait on many bots at once: begin_*() sends
+    # the request and returns True if a reply line must be collected
+    # (through poll() or readline()) and passed to end_*().
+
+    def begin_init(self):
+        if not self.alive:
+            return False
+        self._send(self._init_state())
+        self._wait(self.INIT_TIMEOUT, self.INIT_TIMEOUT)
+        return True
+
+    def end_init(self, line):
+        reply = self._decode(line)
+        if not (isinstance(reply, dict) and
+                "name" in reply and
+                isinstance(reply["name"], basestring)):
+            raise CommError("Bot did not greet with name")
+        self.player.name = reply["name"]
+
+    def begin_turn(self):
+        self.last_move = self.last_status = None
+        if not self.alive:
+            return False
+        self._send(self._turn_state())
+        self._wait(self.MOVE_TIMEOUT, self.MOVE_HARDTIMEOUT)
+        return True
+
+    def end_turn(self, line):
+        move = self._decode(line)
+        status = self._execute(move)
+        self.last_move, self.last_status = move, status
+        self._send(status)
+
+    def initialize(self):
+        if self.begin_init():
+            self.end_init(self.readline())
+
+    def turn(self):
+        if self.begin_turn():
+            self.end_turn(self.readline())
 
     def close(self):
         if self.alive:
-            self.p.stdin.close()
+            try:
+                self.p.stdin.close()
+            except IOError:
+                pass
             self.p.stdout.close()
             for i in range(100):
                 time.sleep(0.01)
@@ -139,5 +228,165 @@ class BotPlayer(object):
             sys.stderr.write("Bot %r exit code: %r\n" % (self.player.name, self.p.wait()))
             self.alive = False
 
+    def begin_close(self):
+        """close() for event loops, which must not block: closes the pipes
+        and terminates the bot. Returns True if reap() must then be called
+        until it returns True."""
+        if not self.alive:
+            return False
+        self.alive = False
+        try:
+            self.p.stdin.close()
+        except IOError:
+            pass
+        self.p.stdout.close()
+        try:
+            self.p.terminate()
+        except OSError:
+            pass
+        self._kill_at = time.time() + self.KILL_GRACE
+        return True
+
+    def reap(self):
+        """After begin_close(): True once the bot has exited. Kills it if it
+        is still running KILL_GRACE seconds after begin_close()."""
+        code = self.p.poll()
+        if code is None:
+            if time.time() < self._kill_at:
+                return False
+            try:
+                self.p.kill()
+            except OSError:
+                pass
+            code = self.p.wait()
+        sys.stderr.write("Bot %r exit code: %r\n" % (self.player.name, code))
+        return True
+
     def __del__(self):
         self.close()
+
+class InProcessPlayer(BotPlayer):
+    """Runs a trusted Python bot in the engine process.
+
+    bot_factory is called with the init state and must return an object
+    with a play(state) method; success() and error(message, move) are
+    called after each move if the bot defines them, like interface.Interface
+    does, and so is close() when the player is closed. Moves go through the
+    same validation as subprocess bots.
+    """
+    def __init__(self, game, playernum, bot_factory, debug=False):
+        self.alive = True
+        self.game = game
+        self.player = game.players[playernum]
+        self.debug = debug
+        self.last_move = self.last_status = None
+        self.bot_factory = bot_factory
+        self.bot = None
+
+    def _call(self, fn, *args):
+        try:
+            return fn(*args)
+        except Exception as e:
+            raise CommError("Bot %r raised: %r" % (self.player.name, e))
+
+    def begin_init(self):
+        self.initialize()
+        return False
+
+    def begin_turn(self):
+        self.turn()
+        return False
+
+    def initialize(self):
+        if not self.alive:
+            return
+        state = self._init_state()
+        state["map"] = [list(row) for row in state["map"]]
+        self.bot = self._call(self.bot_factory, state)
+        name = getattr(self.bot, "NAME", None)
+        if not isinstance(name, basestring):
+            raise CommError("Bot did not greet with name")
+        self.player.name = name
+
+    def turn(self):
+        self.last_move = self.last_status = None
+        if not self.alive:
+            return
+        state = self._turn_state()
+        et = time.time() + self.MOVE_TIMEOUT
+        move = self._call(self.bot.play, state)
+        if time.time() > et:
+            sys.stderr.write("Bot %r over soft timeout\n" % self.player.name)
+        if self.debug:
+            print "<<P%d: %r" % (self.player.num, move)
+        status = self._execute(move)
+        self.last_move, self.last_status = move, status
+        if status["success"]:
+            if hasattr(self.bot, "success"):
+                self._call(self.bot.success)
+        elif hasattr(self.bot, "error"):
+            self._call(self.bot.error, status["message"], move)
+
+    def close(self):
+        if self.alive:
+            self.alive = False
+            # Bots that save state on exit (mk3's checkpoint) do it here.
+            if self.bot is not None and hasattr(self.bot, "close"):
+                try:
+                    self._call(self.bot.close)
+                except CommError as e:
+                    sys.stderr.write("%s\n" % e)
+
+    def begin_close(self):
+        self.close()
+        return False
+
+def _takes_learn(cls):
+    try:
+        return "learn" in inspect.getargspec(cls.__init__).args
+    except TypeError:
+        return False
+
+def bot_factory(cls, learn=False):
+    """Factory for interface.Bot subclasses (constructed with the init
+    state) and IronBot-style classes (constructed empty, then initialize).
+
+    Classes that take a learn argument, like IronBot mk3, get learn. It is
+    off by default: an in-process bot that trains would write checkpoints
+    into the cwd next to those of other copies and of mark3/train.py."""
+    def factory(init_state):
+        if hasattr(cls, "initialize"):
+            if _takes_learn(cls):
+                bot = cls(learn=learn)
+            else:
+                bot = cls()
+            bot.initialize(init_state)
+            return bot
+        return cls(init_state)
+    return factory
+
+_modules = {}
+
+def load_bot(spec):
+    """Load an in-process bot from a "py:<file.py>:<class>" spec. A
+    "py:<file.py>:<class>:learn" spec lets a learning bot train."""
+    try:
+        fields = spec.split(":")
+        learn = fields[3:] == ["learn"]
+        if learn:
+            fields = fields[:3]
+        prefix, path, name = fields
+        assert prefix == "py"
+    except (ValueError, AssertionError):
+        raise ValueError("Bot spec must be py:<file.py>:<class>[:learn], got %r" % spec)
+    path = os.path.abspath(path)
+    if path not in _modules:
+        # Bots import their siblings (interface, dqn_agent) by name.
+        bot_dir = os.path.dirname(path)
+        if bot_dir not in sys.path:
+            sys.path.insert(0, bot_dir)
+        _modules[path] = imp.load_source("_bot%d" % len(_modules), path)
+    return bot_factory(getattr(_modules[path], name), learn)
+
+def is_inprocess(spec):
+    return spec.startswith("py:")
@@ -2,6 +2,11 @@
 
 import geom, math
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class MoveError(Exception):
     pass
 
@@ -11,11 +16,26 @@ class GameError(Exception):
 class Island(object):
     MAX_ENERGY = 100
     HORIZON = 3
-    def __init__(self, island_map):
+    def __init__(self, island_map, vectorized=False):
         self._island = island_map
         self.h = len(self._island)
         self.w = len(self._island[0])
-        self._energymap = [[0] * self.w for i in xrange(self.h)]
+        self.vectorized = vectorized
+        if vectorized:
+            if numpy is None:
+                raise GameError("Vectorized mode requires numpy")
+            self._energymap = numpy.zeros((self.h, self.w), dtype=int)
+            self._mask = numpy.array(self._island, dtype=int)
+        else:
+            self._energymap = [[0] * self.w for i in xrange(self.h)]
+        # Cells whose energy changed since take_changes(), or None when
+        # nobody asked for them (see track_changes).
+        self.changed = None
+        # Vectorized growth: the cells the growth field reaches, and those
+        # of them below MAX_ENERGY, which the next grow() changes.
+        self._grow_field = None
+        self._grow_cells = frozenset()
+        self._growing = set()
         self._horizonmap = []
         dist = self.HORIZON
         for y in xrange(-dist, dist + 1):
@@ -28,7 +48,7 @@ class Island(object):
             def __getitem__(unused, pos):
                 x, y = pos
                 if self[pos]:
-                    return self._energymap[y][x]
+                    return int(self._energymap[y][x])
                 else:
                     return 0
             def __setitem__(unused, pos, val):
@@ -37,6 +57,11 @@ class Island(object):
                     val = self.MAX_ENERGY
                 assert val >= 0
                 if self[pos]:
+                    if self.changed is not None:
+                        if self._energymap[y][x] != val:
+                            self.changed.add(pos)
+                        if val < self.MAX_ENERGY and pos in self._grow_cells:
+                            self._growing.add(pos)
                     self._energymap[y][x] = val
         self._energy = _Energy()
 
@@ -51,6 +76,47 @@ class Island(object):
     def energy(self):
         return self._energy
 
+    def energy_rows(self):
+        # Snapshot of the energy map as a list of rows (row y, column x).
+        if self.vectorized:
+            return self._energymap.tolist()
+        return [list(row) for row in self._energymap]
+
+    def track_changes(self):
+        # Start recording the cells whose energy changes, for a viewer.
+        self.changed = set()
+        self._grow_field = None
+
+    def take_changes(self):
+        changed = self.changed
+        self.changed = set()
+        return changed
+
+    def set_energy_rows(self, rows):
+        for y, row in enumerate(rows):
+            for x, e in enumerate(row):
+                self.energy[x, y] = e
+
+    def grow(self, field):
+        # Vectorized mode only: add a growth field to the whole energy map,
+        # clamp and clear everything outside the island.
+        e = self._energymap
+        e += field
+        numpy.minimum(e, self.MAX_ENERGY, out=e)
+        e *= self._mask
+        if self.changed is not None:
+            # The growing cells, marked in one go. The field is the same
+            # every round, so the cells it reaches are found once; a full
+            # cell only grows again after it is drained (see _Energy).
+            if field is not self._grow_field:
+                ys, xs = numpy.nonzero(field * self._mask)
+                self._grow_field = field
+                self._grow_cells = frozenset(zip(xs.tolist(), ys.tolist()))
+                self._growing = set(self._grow_cells)
+            self.changed.update(self._growing)
+            self._growing = set((x, y) for x, y in self._growing
+                                if e[y, x] < self.MAX_ENERGY)
+
     def get_view(self, pos):
         px, py = pos
         dist = self.HORIZON
@@ -89,6 +155,8 @@ class Lighthouse(object):
             self.decay(d)
             strength -= d
         if strength:
+            if self.owner != player.num:
+                player.score_rate += 2
             self.owner = player.num
             self.energy += strength
 
@@ -96,9 +164,10 @@ class Lighthouse(object):
         self.energy -= by
         if self.energy <= 0:
             self.energy = 0
+            if self.owner is not None:
+                self.game.players[self.owner].score_rate -= 2
+                self.game.disconnect(self.pos)
             self.owner = None
-            self.game.conns = set(i for i in self.game.conns if self.pos not in i)
-            self.game.tris = dict(i for i in self.game.tris.iteritems() if self.pos not in i[0])
 
 class Player(object):
     def __init__(self, game, num, init_pos):
@@ -106,6 +175,9 @@ class Player(object):
         self.game = game
         self.pos = init_pos
         self.score = 0
+        # Points added to score every round, kept up to date by attack,
+        # connect and decay.
+        self.score_rate = 0
         self.energy = 0
         self.keys = set()
         self.name = "Player %d" % num
@@ -114,15 +186,18 @@ class Player(object):
         dx, dy = delta
         if dx not in (0, 1, -1) or dy not in (0, 1, -1):
             raise MoveError("Delta must be 1 cell away")
-        new_pos = self.pos[0] + dx, self.pos[1] + dy
+        # 1.0 passes the check above; keep positions integers.
+        new_pos = self.pos[0] + int(dx), self.pos[1] + int(dy)
         if not self.game.island[new_pos]:
             raise MoveError("Target pos is not in island")
         self.pos = new_pos
 
 class GameConfig(object):
-    def __init__(self, mapfile):
-        with open(mapfile, "r") as fd:
-            lines = [l.replace("\n", "") for l in fd.readlines()]
+    def __init__(self, mapfile, lines=None):
+        if lines is None:
+            with open(mapfile, "r") as fd:
+                lines = [l.replace("\n", "") for l in fd.readlines()]
+        self.lines = lines
         self.lighthouses = []
         players = []
         self.island = []
@@ -152,14 +227,25 @@ class GameConfig(object):
 
 class Game(object):
     RDIST = 5
-    def __init__(self, cfg, numplayers=None):
+    def __init__(self, cfg, numplayers=None, vectorized=False):
         if numplayers is None:
             numplayers = len(cfg.players)
         assert numplayers <= len(cfg.players)
-        self.island = Island(cfg.island)
+        self.island = Island(cfg.island, vectorized)
+        self.vectorized = vectorized
+        if vectorized:
+            self._growth = self._growth_kernel(cfg.lighthouses)
         self.lighthouses = dict((x, Lighthouse(self, x)) for x in cfg.lighthouses)
         self.conns = set()
         self.tris = dict()
+        # Per-lighthouse index of connected lighthouses and of the triangles
+        # it is a vertex of, kept in sync with conns and tris.
+        self.lh_conns = dict((x, set()) for x in cfg.lighthouses)
+        self.lh_tris = dict((x, set()) for x in cfg.lighthouses)
+        self.segments = geom.SegmentIndex()
+        self._tri_cache = dict()
+        for pos in cfg.lighthouses:
+            self.segments.add_point(pos)
         self.players = [Player(self, i, pos) for i, pos in enumerate(cfg.players[:numplayers])]
 
     def connect(self, player, dest_pos):
@@ -179,35 +265,114 @@ class Game(object):
         pair = frozenset((orig.pos, dest.pos))
         if pair in self.conns:
             raise MoveError("Connection already exists")
-        x0, x1 = sorted((orig.pos[0], dest.pos[0]))
-        y0, y1 = sorted((orig.pos[1], dest.pos[1]))
-        for lh in self.lighthouses:
-            if (x0 <= lh[0] <= x1 and y0 <= lh[1] <= y1 and
-                lh not in (orig.pos, dest.pos) and
-                geom.colinear(orig.pos, dest.pos, lh)):
-                raise MoveError("Connection cannot intersect a lighthouse")
-        new_tris = set()
-        for c in self.conns:
-            if geom.intersect(tuple(c), (orig.pos, dest.pos)):
-                raise MoveError("Connection cannot intersect another connection")
-            if orig.pos in c:
-                third = (l for l in c if l != orig.pos).next()
-                if frozenset((third, dest.pos)) in self.conns:
-                    new_tris.add((orig.pos, dest.pos, third))
+        if self.segments.hits_point(orig.pos, dest.pos):
+            raise MoveError("Connection cannot intersect a lighthouse")
+        if self.segments.crosses(orig.pos, dest.pos):
+            raise MoveError("Connection cannot intersect another connection")
+        new_tris = set((orig.pos, dest.pos, third) for third in
+                       self.lh_conns[orig.pos] & self.lh_conns[dest.pos])
 
         player.keys.remove(dest.pos)
         self.conns.add(pair)
+        self.segments.add(orig.pos, dest.pos)
+        self.lh_conns[orig.pos].add(dest.pos)
+        self.lh_conns[dest.pos].add(orig.pos)
+        player.score_rate += 2
         for i in new_tris:
-            self.tris[i] = [j for j in geom.render(i) if self.island[j]]
+            self.tris[i] = self._tri_cells(i)
+            player.score_rate += len(self.tris[i])
+            for pos in i:
+                self.lh_tris[pos].add(i)
 
-    def pre_round(self):
+    def _tri_cells(self, tri):
+        # Island cells of a triangle, memoized by vertex set: the cell set
+        # does not depend on vertex order, and triangles are often rebuilt
+        # after a decay and reconnect.
+        key = tuple(sorted(tri))
+        if key not in self._tri_cache:
+            if self.vectorized:
+                xs, ys = geom.render_array(key)
+                keep = self.island._mask[ys, xs] != 0
+                cells = zip(xs[keep].tolist(), ys[keep].tolist())
+            else:
+                cells = [j for j in geom.render(key) if self.island[j]]
+            self._tri_cache[key] = cells
+        return list(self._tri_cache[key])
+
+    def disconnect(self, pos):
+        player = self.players[self.lighthouses[pos].owner]
+        player.score_rate -= 2 * len(self.lh_conns[pos])
+        for other in self.lh_conns[pos]:
+            self.conns.discard(frozenset((pos, other)))
+            self.segments.remove(pos, other)
+            self.lh_conns[other].discard(pos)
+        self.lh_conns[pos].clear()
+        for tri in self.lh_tris[pos]:
+            player.score_rate -= len(self.tris.pop(tri))
+            for other in tri:
+                if other != pos:
+                    self.lh_tris[other].discard(tri)
+        self.lh_tris[pos].clear()
+
+    def reindex(self):
+        # Rebuild tris, the per-lighthouse and segment indexes and the score
+        # rates from lighthouses and conns, e.g. after restoring a snapshot.
+        self.tris = dict()
+        self.lh_conns = dict((x, set()) for x in self.lighthouses)
+        self.lh_tris = dict((x, set()) for x in self.lighthouses)
+        self.segments = geom.SegmentIndex()
         for pos in self.lighthouses:
-            for y in xrange(pos[1]-self.RDIST+1, pos[1]+self.RDIST):
-                for x in xrange(pos[0]-self.RDIST+1, pos[0]+self.RDIST):
+            self.segments.add_point(pos)
+        for player in self.players:
+            player.score_rate = 0
+        for lh in self.lighthouses.itervalues():
+            if lh.owner is not None:
+                self.players[lh.owner].score_rate += 2
+        for pair in self.conns:
+            a, b = pair
+            self.segments.add(a, b)
+            self.lh_conns[a].add(b)
+            self.lh_conns[b].add(a)
+            self.players[self.lighthouses[a].owner].score_rate += 2
+        for pair in self.conns:
+            a, b = sorted(pair)
+            player = self.players[self.lighthouses[a].owner]
+            for third in self.lh_conns[a] & self.lh_conns[b]:
+                if third < b:
+                    continue
+                tri = (a, b, third)
+                self.tris[tri] = self._tri_cells(tri)
+                player.score_rate += len(self.tris[tri])
+                for pos in tri:
+                    self.lh_tris[pos].add(tri)
+
+    def _growth_kernel(self, lighthouses):
+        # Per-round energy increment of every cell, summed over all
+        # lighthouses. Clamping each addition to MAX_ENERGY is the same as
+        # clamping the sum, so one add + clamp per round is exact.
+        kernel = numpy.zeros((self.island.h, self.island.w), dtype=int)
+        for pos in lighthouses:
+            for y in xrange(max(pos[1]-self.RDIST+1, 0),
+                            min(pos[1]+self.RDIST, self.island.h)):
+                for x in xrange(max(pos[0]-self.RDIST+1, 0),
+                                min(pos[0]+self.RDIST, self.island.w)):
                     dist = geom.dist(pos, (x,y))
                     delta = int(math.floor(self.RDIST - dist))
                     if delta > 0:
-                        self.island.energy[x,y] += delta
+                        kernel[y, x] += delta
+        return kernel
+
+    def pre_round(self):
+        if self.vectorized:
+            self.island.grow(self._growth)
+        else:
+            for pos in self.lighthouses:
+                for y in xrange(pos[1]-self.RDIST+1, pos[1]+self.RDIST):
+                    for x in xrange(pos[0]-self.RDIST+1, pos[0]+self.RDIST):
+                        dist = geom.dist(pos, (x,y))
+                        delta = int(math.floor(self.RDIST - dist))
+                        if delta > 0:
+                            self.island.energy[x,y] += delta
         player_posmap = dict()
         for player in self.players:
             if player.pos in player_posmap:
@@ -225,10 +390,5 @@ class Game(object):
             lh.decay(10)
 
     def post_round(self):
-        for lh in self.lighthouses.itervalues():
-            if lh.owner is not None:
-                self.players[lh.owner].score += 2
-        for pair in self.conns:
-            self.players[self.lighthouses[iter(pair).next()].owner].score += 2
-        for tri, cells in self.tris.iteritems():
-            self.players[self.lighthouses[tri[0]].owner].score += len(cells)
+        for player in self.players:
+            player.score += player.score_rate
@@ -0,0 +1,138 @@
+#!/usr/bin/python
+
+# Gym-style environment around engine.Game, to train a bot in-process
+# against in-process opponents:
+#
+#   e = env.LighthouseEnv(rounds=1000)
+#   state = e.reset("maps/grid.txt", ["py:examples/RandBot/randbot.py:RandBot"])
+#   while True:
+#       state, reward, done, info = e.step(action)
+#
+# Actions and states use the layout of IronBot mk3 (see vecgame.py); the
+# reward is the change of the learner's score since its previous turn, and
+# info["success"] tells whether the engine accepted the move.
+
+import sys, time, random, optparse
+import numpy
+import engine, botplayer, replay, vecgame
+
+class LighthouseEnv(object):
+    def __init__(self, rounds=1000, seat=0, vectorized=False):
+        self.rounds = rounds
+        self.seat = seat
+        self.vectorized = vectorized
+        self.game = None
+
+    def reset(self, cfg_file, opponents):
+        """Start a game on cfg_file against opponents, given as bot specs
+        ("py:<file.py>:<class>") or bot classes. Opponents that can learn,
+        like IronBot mk3, only play: their checkpoints would clash with
+        mark3/train.py's. Returns the first state."""
+        cfg = engine.GameConfig(cfg_file)
+        if self.seat > len(opponents):
+            raise ValueError("Seat %d needs %d opponents" % (self.seat, self.seat))
+        self.game = engine.Game(cfg, 1 + len(opponents), self.vectorized)
+        self.lighthouses = vecgame.mk3_lighthouses(self.game.lighthouses)
+        self.dist = [vecgame.dist_map(cfg.island, pos) for pos in self.lighthouses]
+        self.n_actions = vecgame.mk3_n_actions(len(self.lighthouses))
+        self.state_size = vecgame.mk3_state_size(len(self.lighthouses))
+
+        seats = [i for i in xrange(len(self.game.players)) if i != self.seat]
+        self.opponents = []
+        for i, bot in zip(seats, opponents):
+            if isinstance(bot, basestring):
+                factory = botplayer.load_bot(bot)
+            else:
+                factory = botplayer.bot_factory(bot)
+            actor = botplayer.InProcessPlayer(self.game, i, factory)
+            self._run(actor, actor.initialize)
+            self.opponents.append(actor)
+        self.actor = replay.ReplayPlayer(self.game, self.seat)
+        self.player = self.game.players[self.seat]
+        self.round = 0
+        self.last_score = 0
+        self.game.pre_round()
+        self._play_opponents(0, self.seat)
+        return self.observe()
+
+    def step(self, action):
+        game = self.game
+        status = self.actor.play(self.action(action))
+        self._play_opponents(self.seat, len(game.players))
+        game.post_round()
+        self.round += 1
+        done = self.round >= self.rounds
+        if not done:
+            game.pre_round()
+            self._play_opponents(0, self.seat)
+        reward = self.player.score - self.last_score
+        self.last_score = self.player.score
+        return self.observe(), reward, done, status
+
+    def _run(self, actor, fn):
+        try:
+            fn()
+        except botplayer.CommError as e:
+            sys.stderr.write("Bot %r dropped: %s\n" % (actor.player.name, e))
+            actor.close()
+
+    def _play_opponents(self, start, end):
+        for actor in self.opponents:
+            if start <= actor.player.num < end:
+                self._run(actor, actor.turn)
+
+    def action(self, i):
+        """Move of mk3 action number i for the learner."""
+        x, y = self.player.pos
+        nl = len(self.lighthouses)
+        if i < 8:
+            dy, dx = vecgame.MOVES[i]
+        elif i == 8:
+            return {"command": "attack", "energy": self.player.energy}
+        elif i < 9 + nl:
+            dist = self.dist[i - 9]
+            dy, dx = min(vecgame.TIE_ORDER, key=lambda m: dist[y + m[0], x + m[1]])
+        else:
+            return {"command": "connect",
+                    "destination": list(self.lighthouses[i - 9 - nl])}
+        return {"command": "move", "x": dx, "y": dy}
+
+    def observe(self):
+        """The learner's state, as mk3's IronBot.get_state builds it."""
+        game = self.game
+        x, y = self.player.pos
+        lhs = []
+        for pos, dist in zip(self.lighthouses, self.dist):
+            lh = game.lighthouses[pos]
+            lhs.append([lh.energy, pos in self.player.keys, lh.owner == self.seat,
+                        len(game.lh_conns[pos]), dist[y, x]])
+        return numpy.concatenate((
+            numpy.array(game.island.get_view(self.player.pos)).flatten(),
+            [self.player.energy],
+            numpy.array(lhs, dtype=float).flatten(),
+        ))
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] <map> <opponent spec>...")
+    parser.add_option("-r", "--rounds", type="int", default=1000,
+                      help="rounds per episode (default: %default)")
+    parser.add_option("--vectorized", action="store_true", default=False,
+                      help="use the NumPy energy field")
+    opts, args = parser.parse_args()
+    if len(args) < 2:
+        parser.error("a map and at least one opponent are required")
+
+    env = LighthouseEnv(opts.rounds, vectorized=opts.vectorized)
+    env.reset(args[0], args[1:])
+    rng = random.Random(0)
+    total = 0
+    st = time.time()
+    done = False
+    while not done:
+        state, reward, done, info = env.step(rng.randrange(env.n_actions))
+        total += reward
+    elapsed = time.time() - st
+    print "%d steps, %.0f steps/s, score %d" % (opts.rounds, opts.rounds / elapsed, total)
+
+if __name__ == "__main__":
+    main()
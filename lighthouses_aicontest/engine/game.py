@@ -1,34 +1,60 @@
 #!/usr/bin/python
 
-import sys, time
-import engine, botplayer
-import view
+import sys, os, subprocess, optparse
+import match, stream
 
-cfg_file = sys.argv[1]
-bots = sys.argv[2:]
+parser = optparse.OptionParser(usage="%prog [options] <map> <bot command>...")
+parser.add_option("-r", "--rounds", type="int", default=None,
+                  help="stop after this many rounds (default: play forever)")
+parser.add_option("--vectorized", action="store_true", default=False,
+                  help="use the NumPy energy field")
+parser.add_option("--record", default=None, metavar="FILE",
+                  help="save a replay of the match (see replay.py)")
+parser.add_option("--fps", type="float", default=30,
+                  help="viewer frame rate cap (default: %default)")
+parser.add_option("--inline-view", action="store_true", default=False,
+                  help="draw from the game loop instead of a viewer process")
+opts, args = parser.parse_args()
+if len(args) < 2:
+    parser.error("a map and at least one bot are required")
+
+cfg_file = args[0]
+bots = args[1:]
 DEBUG = False
 
-config = engine.GameConfig(cfg_file)
-game = engine.Game(config, len(bots))
-actors = [botplayer.BotPlayer(game, i, cmdline, debug=DEBUG) for i, cmdline in enumerate(bots)]
-
-for actor in actors:
-    actor.initialize()
-
-view = view.GameView(game)
-
-round = 0
-while True:
-    game.pre_round()
-    view.update()
-    for actor in actors:
-        actor.turn()
-        view.update()
-    game.post_round()
-    print "########### ROUND %d SCORE:" % round,
-    for i in range(len(bots)):
-        print "P%d: %d" % (i, game.players[i].score),
-    print
-    round += 1
-
-view.update()
+m = match.Match(cfg_file, bots, debug=DEBUG, vectorized=opts.vectorized,
+                record=opts.record)
+game = m.game
+
+m.initialize()
+
+publisher = None
+if opts.inline_view:
+    import view
+    view = view.GameView(game)
+    update = view.update
+else:
+    # The viewer runs in its own process and is fed state deltas over a
+    # pipe that the game never blocks on.
+    rfd, wfd = os.pipe()
+    viewer = os.path.join(os.path.dirname(os.path.abspath(__file__)), "viewer.py")
+    subprocess.Popen([sys.executable, viewer, "--fps", str(opts.fps)],
+                     stdin=rfd, close_fds=True)
+    os.close(rfd)
+    publisher = stream.Publisher(game, wfd)
+    update = lambda: publisher.publish(m.round)
+
+try:
+    while opts.rounds is None or m.round < opts.rounds:
+        m.play_round(update)
+        print "########### ROUND %d SCORE:" % (m.round - 1),
+        for i in range(len(bots)):
+            print "P%d: %d" % (i, game.players[i].score),
+        print
+
+    update()
+    if publisher is not None:
+        publisher.close()
+finally:
+    # Also on ^C, so that the replay gets its index.
+    m.close()
@@ -1,31 +1,40 @@
 #!/usr/bin/python
-import math
+import sys, os, math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The crossing and triangle coverage rules live in the repository's ironlib
+# package, so the bots apply exactly the same ones without importing the
+# engine.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from ironlib.geometry import (orient2d, colinear, intersect, SegmentIndex,
+                              _bias, render_spans)
 
 def dist(a, b):
     x0, y0 = a
     x1, y1 = b
     return math.sqrt((x0-x1)**2 + (y0-y1)**2)
 
-def orient2d(a, b, c):
-    return (b[0] - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (b[1] - a[1])
-
-def colinear(a, b, c):
-    return orient2d(a, b, c) == 0
-
-def intersect(j, k):
-    j1, j2 = j
-    k1, k2 = k
-    return (
-        orient2d(k1, k2, j1) * orient2d(k1, k2, j2) < 0 and
-        orient2d(j1, j2, k1) * orient2d(j1, j2, k2) < 0)
+def render(points):
+    for y, x0, x1 in render_spans(points):
+        for x in xrange(x0, x1+1):
+            yield x, y
 
-def _bias(p0, p1):
-    if (p0[1] == p1[1] and p0[0] > p1[0]) or p0[1] > p1[1]:
-        return 0
-    else:
-        return -1
+def render_array(points):
+    """render() as a pair of NumPy arrays (xs, ys). Requires numpy."""
+    xs = []
+    ys = []
+    for y, x0, x1 in render_spans(points):
+        xs.append(numpy.arange(x0, x1+1))
+        ys.append(numpy.repeat(y, x1 - x0 + 1))
+    if not xs:
+        return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int)
+    return numpy.concatenate(xs), numpy.concatenate(ys)
 
-def render(points):
+def _render_slow(points):
     v0, v1, v2 = points
     if orient2d(v0, v1, v2) < 0:
         v0, v1 = v1, v0
@@ -42,7 +51,6 @@ def render(points):
             if w0 >= 0 and w1 >= 0 and w2 >= 0:
                 yield p
 
-
 def _rendertest(points):
     w = 1+max(p[0] for p in points)
     h = 1+max(p[1] for p in points)
@@ -65,5 +73,19 @@ if __name__ == "__main__":
     assert not intersect(((0,0),(2,2)),((4,1),(1,4)))
     assert not intersect(((0,0),(2,2)),((3,1),(1,3)))
     assert intersect(((0,0),(2,2)),((2,1),(1,2))) 
+    idx = SegmentIndex(2)
+    idx.add((0,0),(9,9))
+    idx.add_point((5,1))
+    assert idx.crosses((9,0),(0,9))
+    assert not idx.crosses((1,0),(9,8))
+    assert idx.hits_point((3,3),(7,-1))
+    assert not idx.hits_point((3,3),(4,2))
+    idx.remove((0,0),(9,9))
+    assert not idx.crosses((9,0),(0,9))
+    for tri in (((0,0),(5,0),(0,5)), ((5,5),(5,0),(0,5)), ((0,0),(7,2),(3,9)),
+                ((1,1),(9,3),(2,4)), ((0,0),(1,9),(2,0)), ((4,4),(0,0),(8,8))):
+        for order in ((0,1,2), (1,0,2), (2,1,0)):
+            t = [tri[i] for i in order]
+            assert list(render(t)) == list(_render_slow(t))
     _rendertest(((0,0),(5,0),(0,5)))
     _rendertest(((5,5),(5,0),(0,5)))
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+
+import sys
+import engine, botplayer, replay
+
+class Match(object):
+    def __init__(self, cfg_file, bots, debug=False, vectorized=False,
+                 stderr=None, env=None, record=None):
+        self.cfg_file = cfg_file
+        self.bots = bots
+        self.config = engine.GameConfig(cfg_file)
+        self.game = engine.Game(self.config, len(bots), vectorized)
+        self.actors = []
+        for i, bot in enumerate(bots):
+            if botplayer.is_inprocess(bot):
+                actor = botplayer.InProcessPlayer(self.game, i,
+                                                  botplayer.load_bot(bot),
+                                                  debug=debug)
+            else:
+                actor = botplayer.BotPlayer(self.game, i, bot, debug=debug,
+                                            stderr=stderr, env=env)
+            self.actors.append(actor)
+        self.errors = [None] * len(bots)
+        self.round = 0
+        self.recorder = None
+        if record is not None:
+            self.recorder = replay.Recorder(record, self)
+
+    def drop(self, actor, e, close=None):
+        """Record e as the error of actor and close it, with close(actor)
+        instead of actor.close() if given."""
+        sys.stderr.write("Bot %r dropped: %s\n" % (actor.player.name, e))
+        self.errors[actor.player.num] = str(e)
+        if close is None:
+            actor.close()
+        else:
+            close(actor)
+
+    def initialize(self):
+        for actor in self.actors:
+            try:
+                actor.initialize()
+            except botplayer.CommError as e:
+                self.drop(actor, e)
+
+    def begin_round(self):
+        if self.recorder is not None:
+            self.recorder.begin_round()
+        self.game.pre_round()
+
+    def end_round(self):
+        self.game.post_round()
+        if self.recorder is not None:
+            self.recorder.end_round()
+        self.round += 1
+
+    def play_round(self, update=None):
+        self.begin_round()
+        if update is not None:
+            update()
+        for actor in self.actors:
+            try:
+                actor.turn()
+            except botplayer.CommError as e:
+                self.drop(actor, e)
+            if update is not None:
+                update()
+        self.end_round()
+
+    def run(self, rounds, update=None):
+        self.initialize()
+        while rounds is None or self.round < rounds:
+            self.play_round(update)
+
+    def close(self):
+        for actor in self.actors:
+            actor.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def scores(self):
+        return [{
+            "player": player.num,
+            "name": player.name,
+            "bot": self.bots[player.num],
+            "score": player.score,
+            "error": self.errors[player.num],
+        } for player in self.game.players]
+
+    def result(self):
+        return {
+            "map": self.cfg_file,
+            "rounds": self.round,
+            "players": self.scores(),
+        }
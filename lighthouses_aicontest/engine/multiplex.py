@@ -0,0 +1,111 @@
+#!/usr/bin/python
+
+# Drives many matches from a single select() loop. Python 2 has no asyncio,
+# so every match is a generator coroutine that yields the bot it is waiting
+# on and is resumed with the bot's reply line (or a CommError thrown into it
+# on hard timeout). Turn order inside a match is unchanged; what overlaps is
+# the waiting on bots of different matches, and bot start-up inside a match.
+# Dropped bots are terminated without waiting for them to exit, and reaped
+# on later iterations of the loop, so one dropped bot does not stall the
+# other matches.
+
+import time, select
+import botplayer
+
+def play(m, rounds, close=None):
+    """Coroutine playing Match m for the given number of rounds. Dropped
+    bots are closed with close(actor) if given (see Match.drop)."""
+    pending = []
+    for actor in m.actors:
+        try:
+            if actor.begin_init():
+                pending.append(actor)
+        except botplayer.CommError as e:
+            m.drop(actor, e, close)
+    for actor in pending:
+        try:
+            line = yield actor
+            actor.end_init(line)
+        except botplayer.CommError as e:
+            m.drop(actor, e, close)
+
+    while rounds is None or m.round < rounds:
+        m.begin_round()
+        for actor in m.actors:
+            try:
+                if actor.begin_turn():
+                    line = yield actor
+                    actor.end_turn(line)
+            except botplayer.CommError as e:
+                m.drop(actor, e, close)
+        m.end_round()
+
+class Loop(object):
+    REAP_INTERVAL = 0.01
+
+    def __init__(self):
+        self.waiting = {}
+        self.closing = []
+
+    def _advance(self, coro, line=None, error=None):
+        # Resume coro until it waits on a bot whose reply is not buffered yet.
+        while True:
+            try:
+                if error is not None:
+                    actor = coro.throw(error)
+                else:
+                    actor = coro.send(line)
+            except StopIteration:
+                return
+            error = None
+            try:
+                line = actor.poll()
+            except botplayer.CommError as e:
+                error = e
+                continue
+            if line is None:
+                self.waiting[actor.fileno()] = (coro, actor)
+                return
+
+    def add(self, coro):
+        self._advance(coro)
+
+    def close_later(self, actor):
+        """Close actor without blocking; run() reaps it."""
+        if actor.begin_close():
+            self.closing.append(actor)
+
+    def run(self):
+        while self.waiting or self.closing:
+            timeout = self.REAP_INTERVAL
+            if self.waiting:
+                deadline = min(actor.deadline for coro, actor in self.waiting.itervalues())
+                timeout = max(0, deadline - time.time())
+                if self.closing:
+                    timeout = min(timeout, self.REAP_INTERVAL)
+            r,w,e = select.select(list(self.waiting), [], [], timeout)
+            for fd in r:
+                coro, actor = self.waiting.pop(fd)
+                try:
+                    line = actor.poll()
+                except botplayer.CommError as e:
+                    self._advance(coro, error=e)
+                    continue
+                if line is None:
+                    self.waiting[fd] = (coro, actor)
+                else:
+                    self._advance(coro, line)
+            now = time.time()
+            for fd, entry in self.waiting.items():
+                coro, actor = entry
+                if now > actor.deadline and self.waiting.get(fd) is entry:
+                    del self.waiting[fd]
+                    self._advance(coro, error=botplayer.CommError(
+                        "Bot %r over hard timeout" % actor.player.name))
+            self.closing = [actor for actor in self.closing if not actor.reap()]
+
+def run_matches(matches, rounds):
+    loop = Loop()
+    for m in matches:
+        loop.add(play(m, rounds, loop.close_later))
+    loop.run()
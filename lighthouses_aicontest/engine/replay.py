@@ -0,0 +1,407 @@
+#!/usr/bin/python
+
+# Match recordings. A replay file is:
+#
+#   "LHRP", version byte
+#   header block: JSON with the map, the bot commands, the player names and
+#       the keyframe interval
+#   data blocks, one every KEYFRAME rounds: the first round number, a
+#       snapshot of the game at the start of that round, then for every
+#       round the action of each player, the score changes (the first round
+#       of a block has the scores themselves) and a CRC32 of the state at
+#       the end of the round
+#   index: first round and file offset of every data block, followed by the
+#       index offset and "LHRI"
+#
+# Blocks are zlib-compressed and prefixed with their length, so a file
+# without an index (the engine died before closing it) can still be read
+# up to its last complete block. Seeking to a round restores the keyframe
+# before it and plays at most KEYFRAME - 1 recorded rounds.
+
+import sys, os, time, struct, zlib, json, bisect, optparse
+import engine, botplayer
+
+MAGIC = "LHRP"
+INDEX_MAGIC = "LHRI"
+VERSION = 1
+KEYFRAME = 100
+
+# Action kinds. FAILED is set when the engine rejected the move; INVALID
+# stands for moves that cannot be encoded, which never change the game.
+NONE, PASS, MOVE, ATTACK, CONNECT, INVALID = range(6)
+FAILED = 0x80
+MAX_ATTACK = 2**63 - 1
+
+class ReplayError(Exception):
+    pass
+
+def snapshot(game):
+    """Game state at the start of a round, as a compact string."""
+    order = sorted(game.lighthouses)
+    index = dict((pos, i) for i, pos in enumerate(order))
+    energy = [e for row in game.island.energy_rows() for e in row]
+    parts = [struct.pack("<%dB" % len(energy), *energy)]
+    for pos in order:
+        lh = game.lighthouses[pos]
+        owner = lh.owner
+        if owner is None:
+            owner = -1
+        parts.append(struct.pack("<bq", owner, lh.energy))
+    for player in game.players:
+        keys = sorted(index[pos] for pos in player.keys)
+        parts.append(struct.pack("<HHqqH%dH" % len(keys), player.pos[0],
+                                 player.pos[1], player.score, player.energy,
+                                 len(keys), *keys))
+    conns = sorted(sorted((index[a], index[b])) for a, b in game.conns)
+    parts.append(struct.pack("<H", len(conns)))
+    for a, b in conns:
+        parts.append(struct.pack("<HH", a, b))
+    return "".join(parts)
+
+def restore(game, data):
+    """Load a snapshot into a game created from the same config."""
+    order = sorted(game.lighthouses)
+    w, h = game.island.w, game.island.h
+    energy = struct.unpack_from("<%dB" % (w * h), data)
+    game.island.set_energy_rows([energy[y*w:(y+1)*w] for y in xrange(h)])
+    off = w * h
+    for pos in order:
+        owner, energy = struct.unpack_from("<bq", data, off)
+        off += 9
+        lh = game.lighthouses[pos]
+        lh.owner = owner
+        if owner < 0:
+            lh.owner = None
+        lh.energy = energy
+    for player in game.players:
+        x, y, player.score, player.energy, nkeys = struct.unpack_from(
+            "<HHqqH", data, off)
+        off += 22
+        keys = struct.unpack_from("<%dH" % nkeys, data, off)
+        off += 2 * nkeys
+        player.pos = x, y
+        player.keys = set(order[i] for i in keys)
+    nconns, = struct.unpack_from("<H", data, off)
+    off += 2
+    game.conns = set()
+    for i in xrange(nconns):
+        a, b = struct.unpack_from("<HH", data, off)
+        off += 4
+        game.conns.add(frozenset((order[a], order[b])))
+    game.reindex()
+
+def digest(game):
+    return zlib.crc32(snapshot(game)) & 0xffffffff
+
+def _integer(v):
+    """v as an int if it is an integral number (the engine accepts 1.0 as
+    1); ValueError otherwise."""
+    if isinstance(v, (int, long)):
+        return v
+    try:
+        i = int(v)
+    except (TypeError, OverflowError):
+        raise ValueError("not a number: %r" % (v,))
+    if i != v:
+        raise ValueError("not integral: %r" % (v,))
+    return i
+
+def encode_action(move, status):
+    if status is None:
+        return chr(NONE)
+    flags = 0
+    if not status["success"]:
+        flags = FAILED
+    try:
+        command = move["command"]
+        if command == "pass":
+            return chr(PASS | flags)
+        elif command == "move":
+            x, y = _integer(move["x"]), _integer(move["y"])
+            return struct.pack("<Bbb", MOVE | flags, x, y)
+        elif command == "attack":
+            return struct.pack("<Bq", ATTACK | flags,
+                               min(_integer(move["energy"]), MAX_ATTACK))
+        elif command == "connect":
+            x, y = move["destination"]
+            return struct.pack("<BHH", CONNECT | flags, _integer(x), _integer(y))
+    except (KeyError, TypeError, ValueError, struct.error):
+        pass
+    if status["success"]:
+        # Writing INVALID would replay as a no-op and drift from the game.
+        raise ReplayError("Cannot record accepted move %r" % (move,))
+    return chr(INVALID | flags)
+
+def decode_action(data, off):
+    """Returns (move, failed, offset of the next action); move is None for
+    turns that did not change the game."""
+    kind = ord(data[off])
+    failed = bool(kind & FAILED)
+    kind &= ~FAILED
+    off += 1
+    if kind == PASS:
+        return {"command": "pass"}, failed, off
+    elif kind == MOVE:
+        x, y = struct.unpack_from("<bb", data, off)
+        return {"command": "move", "x": x, "y": y}, failed, off + 2
+    elif kind == ATTACK:
+        energy, = struct.unpack_from("<q", data, off)
+        return {"command": "attack", "energy": energy}, failed, off + 8
+    elif kind == CONNECT:
+        x, y = struct.unpack_from("<HH", data, off)
+        return {"command": "connect", "destination": [x, y]}, failed, off + 4
+    elif kind in (NONE, INVALID):
+        return None, failed, off
+    raise ReplayError("Unknown action kind %d" % kind)
+
+def describe(move, failed):
+    if move is None:
+        return "-"
+    command = move["command"]
+    if command == "move":
+        text = "move %d,%d" % (move["x"], move["y"])
+    elif command == "attack":
+        text = "attack %d" % move["energy"]
+    elif command == "connect":
+        text = "connect %d,%d" % tuple(move["destination"])
+    else:
+        text = command
+    if failed:
+        text += " (failed)"
+    return text
+
+class Recorder(object):
+    def __init__(self, path, m, keyframe=KEYFRAME):
+        self.fd = open(path, "wb")
+        self.m = m
+        self.keyframe = keyframe
+        self.index = []
+        self._block = None
+
+    def _write_block(self, data):
+        data = zlib.compress(data, 9)
+        self.fd.write(struct.pack("<I", len(data)))
+        self.fd.write(data)
+
+    def _flush(self):
+        if self._block is not None:
+            self._write_block("".join(self._block))
+            self._block = None
+
+    def begin_round(self):
+        m = self.m
+        if self.fd.tell() == 0:
+            # Written on the first round, once the bots have their names.
+            self.fd.write(MAGIC + chr(VERSION))
+            self._write_block(json.dumps({
+                "map_file": m.cfg_file,
+                "map": m.config.lines,
+                "bots": m.bots,
+                "names": [player.name for player in m.game.players],
+                "keyframe": self.keyframe,
+            }))
+        if self._block is None or m.round % self.keyframe == 0:
+            self._flush()
+            self.index.append((m.round, self.fd.tell()))
+            state = snapshot(m.game)
+            self._block = [struct.pack("<II", m.round, len(state)), state]
+            self._scores = [0] * len(m.game.players)
+
+    def end_round(self):
+        game = self.m.game
+        for actor in self.m.actors:
+            self._block.append(encode_action(actor.last_move, actor.last_status))
+        scores = [player.score for player in game.players]
+        delta = [a - b for a, b in zip(scores, self._scores)]
+        self._scores = scores
+        self._block.append(struct.pack("<%dqI" % len(scores),
+                                       *(delta + [digest(game)])))
+
+    def close(self):
+        if self.fd.closed:
+            return
+        self._flush()
+        if self.index:
+            offset = self.fd.tell()
+            self.fd.write(struct.pack("<I", len(self.index)))
+            for entry in self.index:
+                self.fd.write(struct.pack("<II", *entry))
+            self.fd.write(struct.pack("<I", offset) + INDEX_MAGIC)
+        self.fd.close()
+
+class ReplayPlayer(botplayer.BotPlayer):
+    """Actor that executes recorded moves instead of asking a bot."""
+    def __init__(self, game, playernum):
+        self.alive = True
+        self.game = game
+        self.player = game.players[playernum]
+        self.debug = False
+        self.last_move = self.last_status = None
+
+    def play(self, move):
+        self.last_move = move
+        self.last_status = None
+        if move is not None:
+            self.last_status = self._execute(move)
+        return self.last_status
+
+    def close(self):
+        self.alive = False
+
+def play_round(game, actors, actions):
+    game.pre_round()
+    for actor, (move, failed) in zip(actors, actions):
+        actor.play(move)
+    game.post_round()
+
+class Replay(object):
+    def __init__(self, path):
+        self.fd = open(path, "rb")
+        if self.fd.read(len(MAGIC)) != MAGIC:
+            raise ReplayError("%s is not a replay file" % path)
+        version = ord(self.fd.read(1))
+        if version != VERSION:
+            raise ReplayError("Unsupported replay version %d" % version)
+        self.header = json.loads(self._read_block())
+        self.config = engine.GameConfig(self.header["map_file"], self.header["map"])
+        self.names = self.header["names"]
+        self.index = self._read_index()
+        if self.index is None:
+            self.index = self._scan()
+        if not self.index:
+            raise ReplayError("%s has no rounds" % path)
+        first, snap, records = self.block(len(self.index) - 1)
+        self.rounds = first + len(records)
+
+    def _read_block(self):
+        head = self.fd.read(4)
+        if len(head) < 4:
+            return None
+        size, = struct.unpack("<I", head)
+        data = self.fd.read(size)
+        if len(data) < size:
+            return None
+        try:
+            return zlib.decompress(data)
+        except zlib.error:
+            return None
+
+    def _read_index(self):
+        self.fd.seek(-8, os.SEEK_END)
+        offset, magic = struct.unpack("<I4s", self.fd.read(8))
+        if magic != INDEX_MAGIC:
+            return None
+        self.fd.seek(offset)
+        count, = struct.unpack("<I", self.fd.read(4))
+        return [struct.unpack("<II", self.fd.read(8)) for i in xrange(count)]
+
+    def _scan(self):
+        # No index: walk the data blocks up to the first incomplete one.
+        index = []
+        self.fd.seek(0)
+        self.fd.read(len(MAGIC) + 1)
+        self._read_block()
+        while True:
+            offset = self.fd.tell()
+            data = self._read_block()
+            if data is None:
+                return index
+            first, = struct.unpack_from("<I", data)
+            index.append((first, offset))
+
+    def block(self, i):
+        """First round, snapshot and round records of data block i."""
+        self.fd.seek(self.index[i][1])
+        data = self._read_block()
+        first, size = struct.unpack_from("<II", data)
+        off = 8 + size
+        records = []
+        n = len(self.names)
+        scores = [0] * n
+        while off < len(data):
+            actions = []
+            for j in xrange(n):
+                move, failed, off = decode_action(data, off)
+                actions.append((move, failed))
+            values = struct.unpack_from("<%dqI" % n, data, off)
+            off += struct.calcsize("<%dqI" % n)
+            scores = [a + b for a, b in zip(scores, values[:n])]
+            records.append((first + len(records), actions, scores, values[n]))
+        return first, data[8:8+size], records
+
+    def new_game(self, vectorized=False):
+        game = engine.Game(self.config, len(self.names), vectorized)
+        for player, name in zip(game.players, self.names):
+            player.name = name
+        return game
+
+    def seek(self, round, vectorized=False):
+        """A game at the start of the given round (0 to self.rounds) and
+        its ReplayPlayer actors."""
+        if not 0 <= round <= self.rounds:
+            raise ReplayError("Round %d out of range 0-%d" % (round, self.rounds))
+        i = bisect.bisect_right([first for first, offset in self.index], round) - 1
+        first, snap, records = self.block(i)
+        game = self.new_game(vectorized)
+        restore(game, snap)
+        actors = [ReplayPlayer(game, j) for j in xrange(len(self.names))]
+        for r, actions, scores, state in records[:round - first]:
+            play_round(game, actors, actions)
+        return game, actors
+
+    def records(self, start=0):
+        """Round records (round, actions, scores, digest) from start on."""
+        i = max(0, bisect.bisect_right([first for first, offset in self.index],
+                                       start) - 1)
+        for j in xrange(i, len(self.index)):
+            for record in self.block(j)[2]:
+                if record[0] >= start:
+                    yield record
+
+    def close(self):
+        self.fd.close()
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] <replay file>")
+    parser.add_option("-s", "--seek", type="int", default=0,
+                      help="start at this round (default: %default)")
+    parser.add_option("-n", "--rounds", type="int", default=None,
+                      help="number of rounds to play (default: to the end)")
+    parser.add_option("--view", action="store_true", default=False,
+                      help="draw the game instead of printing the moves")
+    parser.add_option("--fps", type="float", default=30,
+                      help="rounds per second with --view (default: %default)")
+    opts, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error("a replay file is required")
+
+    r = Replay(args[0])
+    print "%s: %d rounds, %s" % (r.header["map_file"], r.rounds, ", ".join(
+        "P%d: %s" % (i, name) for i, name in enumerate(r.names)))
+    game, actors = r.seek(opts.seek)
+    if opts.view:
+        import pygame, view
+        gameview = view.GameView(game)
+        gameview.update()
+    end = r.rounds
+    if opts.rounds is not None:
+        end = min(end, opts.seek + opts.rounds)
+    for round, actions, scores, state in r.records(opts.seek):
+        if round >= end:
+            break
+        play_round(game, actors, actions)
+        if digest(game) != state:
+            sys.stderr.write("Round %d: state does not match the recording\n" % round)
+        if opts.view:
+            gameview.update()
+            pygame.display.set_caption("Round %d" % round)
+            if any(event.type == pygame.QUIT for event in pygame.event.get()):
+                break
+            time.sleep(1.0 / opts.fps)
+        else:
+            print "ROUND %d: %s SCORE: %s" % (round, " | ".join(
+                describe(move, failed) for move, failed in actions), " ".join(
+                "P%d: %d" % (i, score) for i, score in enumerate(scores)))
+
+if __name__ == "__main__":
+    main()
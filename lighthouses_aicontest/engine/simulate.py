@@ -0,0 +1,74 @@
+#!/usr/bin/python
+
+# Plays the moves of recorded matches (see replay.py) against a fresh
+# engine.Game with no bots, as fast as possible, and checks every move
+# result, the scores and the state digest against the recording. Use it to
+# benchmark the engine alone and to catch behaviour changes in engine
+# optimizations: record games with the old engine, simulate with the new.
+
+import sys, time, optparse
+import replay
+
+class DriftError(Exception):
+    pass
+
+def simulate(r, vectorized=False, check=True):
+    """Play all rounds of Replay r from round 0. Returns the number of
+    rounds and the time spent in the engine."""
+    records = list(r.records())
+    game = r.new_game(vectorized)
+    actors = [replay.ReplayPlayer(game, i) for i in xrange(len(r.names))]
+    elapsed = 0.0
+    for round, actions, scores, state in records:
+        st = time.time()
+        replay.play_round(game, actors, actions)
+        elapsed += time.time() - st
+        if not check:
+            continue
+        for actor, (move, failed) in zip(actors, actions):
+            status = actor.last_status
+            if status is not None and status["success"] == failed:
+                raise DriftError("Round %d: %s %s, recorded as %s" % (
+                    round, actor.player.name, replay.describe(move, not failed),
+                    replay.describe(move, failed)))
+        now = [player.score for player in game.players]
+        if now != list(scores):
+            raise DriftError("Round %d: scores %r, recorded %r" % (round, now, list(scores)))
+        if replay.digest(game) != state:
+            raise DriftError("Round %d: state does not match the recording" % round)
+    return len(records), elapsed
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] <replay file>...")
+    parser.add_option("--vectorized", action="store_true", default=False,
+                      help="use the NumPy energy field")
+    parser.add_option("--no-check", dest="check", action="store_false", default=True,
+                      help="only measure speed, do not compare with the recording")
+    opts, args = parser.parse_args()
+    if not args:
+        parser.error("at least one replay file is required")
+
+    total_rounds = 0
+    total_time = 0.0
+    failed = False
+    for path in args:
+        r = replay.Replay(path)
+        try:
+            rounds, elapsed = simulate(r, opts.vectorized, opts.check)
+        except DriftError as e:
+            print "%s: %s" % (path, e)
+            failed = True
+            continue
+        finally:
+            r.close()
+        print "%s: %d rounds, %.1f rounds/s" % (path, rounds, rounds / max(elapsed, 1e-9))
+        total_rounds += rounds
+        total_time += elapsed
+    if total_rounds:
+        print "total: %d rounds, %.1f rounds/s" % (
+            total_rounds, total_rounds / max(total_time, 1e-9))
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
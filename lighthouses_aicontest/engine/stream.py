@@ -0,0 +1,161 @@
+#!/usr/bin/python
+
+# Game state stream between the engine and a separate viewer process.
+#
+# The engine side (Publisher) writes one compact JSON message per line to a
+# non-blocking pipe: a keyframe with the whole state, then deltas with only
+# what changed since the previous message. It never waits for the viewer:
+# while a message is still stuck in the pipe, new frames are dropped and
+# the next one that fits is sent as a keyframe, so deltas always apply to
+# the state the viewer already has.
+#
+# The viewer side (Mirror) applies the messages to a game-like object that
+# view.GameView can draw.
+
+import os, json, errno, fcntl
+import engine, geom
+
+def _tri_key(vertices):
+    return tuple(tuple(vertices[i:i+2]) for i in (0, 2, 4))
+
+class Publisher(object):
+    def __init__(self, game, fd):
+        self.game = game
+        self.fd = fd
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.lighthouses = sorted(game.lighthouses)
+        self.alive = True
+        self.dropped = 0
+        self._out = ""
+        self._keyframe = True
+        self._last = None
+
+    def _flush(self):
+        while self._out:
+            try:
+                n = os.write(self.fd, self._out)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    return False
+                # Viewer went away; the match goes on without it.
+                self.alive = False
+                self._out = ""
+                return False
+            self._out = self._out[n:]
+        return True
+
+    def _state(self, round):
+        game = self.game
+        return {
+            "r": round,
+            "e": game.island.energy_rows(),
+            "l": [[game.lighthouses[pos].owner, game.lighthouses[pos].energy]
+                  for pos in self.lighthouses],
+            "p": [list(player.pos) for player in game.players],
+            "s": [player.score for player in game.players],
+            "c": sorted(list(a) + list(b) for a, b in (tuple(c) for c in game.conns)),
+            "t": sorted([c for v in tri for c in v] for tri in game.tris),
+        }
+
+    def _delta(self, state):
+        last = self._last
+        msg = {"r": state["r"]}
+        energy = []
+        for y, (row, old) in enumerate(zip(state["e"], last["e"])):
+            if row != old:
+                energy.extend([x, y, e] for x, (e, o) in enumerate(zip(row, old))
+                              if e != o)
+        if energy:
+            msg["e"] = energy
+        lhs = [[i] + lh for i, (lh, old) in enumerate(zip(state["l"], last["l"]))
+               if lh != old]
+        if lhs:
+            msg["l"] = lhs
+        for k in ("p", "s", "c", "t"):
+            if state[k] != last[k]:
+                msg[k] = state[k]
+        return msg
+
+    def publish(self, round=None):
+        if not self.alive:
+            return
+        if not self._flush():
+            self.dropped += 1
+            self._keyframe = True
+            return
+        state = self._state(round)
+        if self._keyframe:
+            msg = dict(state)
+            msg["k"] = {
+                "map": self.game.island.map,
+                "lighthouses": self.lighthouses,
+                "names": [player.name for player in self.game.players],
+            }
+            self._keyframe = False
+        else:
+            msg = self._delta(state)
+        self._last = state
+        self._out = json.dumps(msg, separators=(",", ":")) + "\n"
+        self._flush()
+
+    def close(self):
+        # Best effort: give the viewer the final state, then hang up.
+        if self.alive:
+            flags = fcntl.fcntl(self.fd, fcntl.F_GETFL)
+            fcntl.fcntl(self.fd, fcntl.F_SETFL, flags & ~os.O_NONBLOCK)
+            self._flush()
+        os.close(self.fd)
+        self.alive = False
+
+class Mirror(object):
+    """Viewer-side copy of the game, with the attributes GameView reads."""
+    def __init__(self):
+        self.island = None
+        self.round = None
+
+    def _keyframe(self, k):
+        # Keep the island of the same map, so its energy is overwritten in
+        # place and a viewer tracking its changes only redraws what differs.
+        if self.island is None or self.island.map != k["map"]:
+            self.island = engine.Island(k["map"])
+        self.order = [tuple(pos) for pos in k["lighthouses"]]
+        self.lighthouses = dict((pos, engine.Lighthouse(self, pos))
+                                for pos in self.order)
+        self.players = [engine.Player(self, i, None) for i in xrange(len(k["names"]))]
+        for player, name in zip(self.players, k["names"]):
+            player.name = name
+        self._tri_cells = {}
+
+    def apply(self, msg):
+        if "k" in msg:
+            self._keyframe(msg["k"])
+            energy = [(x, y, e) for y, row in enumerate(msg["e"])
+                      for x, e in enumerate(row)]
+            lighthouses = [[i] + lh for i, lh in enumerate(msg["l"])]
+        elif self.island is None:
+            # Nothing to apply a delta to before the first keyframe.
+            return
+        else:
+            energy = msg.get("e", ())
+            lighthouses = msg.get("l", ())
+        for x, y, e in energy:
+            self.island.energy[x, y] = e
+        self.round = msg["r"]
+        for i, owner, energy in lighthouses:
+            lh = self.lighthouses[self.order[i]]
+            lh.owner, lh.energy = owner, energy
+        for player, pos in zip(self.players, msg.get("p", ())):
+            player.pos = tuple(pos)
+        for player, score in zip(self.players, msg.get("s", ())):
+            player.score = score
+        if "c" in msg:
+            self.conns = set(frozenset(((c[0], c[1]), (c[2], c[3]))) for c in msg["c"])
+        if "t" in msg:
+            self.tris = dict((tri, self._cells(tri))
+                             for tri in (_tri_key(t) for t in msg["t"]))
+
+    def _cells(self, tri):
+        if tri not in self._tri_cells:
+            self._tri_cells[tri] = [j for j in geom.render(tri) if self.island[j]]
+        return self._tri_cells[tri]
@@ -0,0 +1,230 @@
+#!/usr/bin/python
+
+import sys, os, json, math, itertools, optparse, multiprocessing
+import engine, match
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from ironlib import seeding
+
+MAPS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "maps")
+Z95 = 1.96
+
+def all_maps(maps_dir=MAPS_DIR):
+    return sorted(os.path.join(maps_dir, f) for f in os.listdir(maps_dir)
+                  if f.endswith(".txt"))
+
+def seats(cfg_file):
+    return len(engine.GameConfig(cfg_file).players)
+
+def expand(group, maps, repeat=1):
+    """All seat permutations of one group of entrants on every map."""
+    jobs = []
+    for cfg_file in maps:
+        if seats(cfg_file) < len(group):
+            continue
+        for order in itertools.permutations(group):
+            for i in xrange(repeat):
+                jobs.append((cfg_file, order))
+    return jobs
+
+def round_robin(entrants, maps, size=2, repeat=1):
+    jobs = []
+    for group in itertools.combinations(range(len(entrants)), size):
+        jobs.extend(expand(group, maps, repeat))
+    return jobs
+
+def swiss_pairing(standings, size=2, played=()):
+    """Group entrants with similar points, strongest first. Each group is
+    filled with the best placed entrants that have not yet met any of its
+    members (played holds frozensets of entrants that met), or in rank
+    order when everyone left has."""
+    order = sorted(standings, key=lambda i: -standings[i])
+    groups = []
+    while len(order) >= size:
+        group = [order.pop(0)]
+        for i in list(order):
+            if len(group) == size:
+                break
+            if not any(frozenset((i, j)) in played for j in group):
+                group.append(i)
+                order.remove(i)
+        while len(group) < size:
+            group.append(order.pop(0))
+        groups.append(tuple(group))
+    return groups
+
+def play(job):
+    cfg_file, bots, seed, rounds, quiet, record_dir = job
+    seeding.seed(seed)
+    env = dict(os.environ)
+    env[seeding.SEED_VAR] = str(seed)
+    stderr = None
+    if quiet:
+        stderr = open(os.devnull, "w")
+    record = None
+    if record_dir is not None:
+        record = os.path.join(record_dir, "%d-%s.lhr" % (
+            seed, os.path.splitext(os.path.basename(cfg_file))[0]))
+    m = match.Match(cfg_file, bots, stderr=stderr, env=env, record=record)
+    try:
+        m.run(rounds)
+    finally:
+        m.close()
+    result = m.result()
+    result["seed"] = seed
+    if record is not None:
+        result["replay"] = record
+    return result
+
+class Tournament(object):
+    def __init__(self, entrants, rounds, seed=0, processes=None, quiet=False,
+                 record_dir=None):
+        self.entrants = entrants
+        self.rounds = rounds
+        self.seed = seed
+        self.processes = processes or multiprocessing.cpu_count()
+        self.quiet = quiet
+        self.record_dir = record_dir
+        self.results = []
+
+    def run(self, schedule):
+        jobs = []
+        for cfg_file, order in schedule:
+            bots = [self.entrants[i] for i in order]
+            seed = self.seed + len(self.results) + len(jobs)
+            jobs.append((cfg_file, bots, seed, self.rounds, self.quiet,
+                         self.record_dir))
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            for result in pool.imap_unordered(play, jobs):
+                self.results.append(result)
+                sys.stderr.write("[%d] %s: %s\n" % (
+                    len(self.results), os.path.basename(result["map"]),
+                    " ".join("%s=%d" % (p["name"], p["score"])
+                             for p in result["players"])))
+        finally:
+            pool.close()
+            pool.join()
+
+    def points(self):
+        points = dict((i, 0.0) for i in xrange(len(self.entrants)))
+        for result in self.results:
+            for i, share in self._wins(result):
+                points[i] += share
+        return points
+
+    def _wins(self, result):
+        players = result["players"]
+        best = max(p["score"] for p in players)
+        winners = [p for p in players if p["score"] == best]
+        for p in players:
+            share = 0.0
+            if p["score"] == best:
+                share = 1.0 / len(winners)
+            yield self.entrants.index(p["bot"]), share
+
+    def standings(self):
+        stats = [{"bot": bot, "games": 0, "wins": 0.0, "scores": []}
+                 for bot in self.entrants]
+        for result in self.results:
+            for i, share in self._wins(result):
+                stats[i]["games"] += 1
+                stats[i]["wins"] += share
+            for p in result["players"]:
+                stats[self.entrants.index(p["bot"])]["scores"].append(p["score"])
+        table = []
+        for s in stats:
+            n = s["games"]
+            if not n:
+                continue
+            rate = s["wins"] / n
+            mean = float(sum(s["scores"])) / n
+            table.append({
+                "bot": s["bot"],
+                "games": n,
+                "wins": s["wins"],
+                "win_rate": rate,
+                "win_rate_ci": wilson(rate, n),
+                "mean_score": mean,
+                "mean_score_ci": mean_ci(s["scores"], mean),
+            })
+        table.sort(key=lambda s: -s["win_rate"])
+        return table
+
+def wilson(p, n, z=Z95):
+    """Wilson score interval for a win rate p over n games."""
+    d = 1 + z * z / n
+    c = (p + z * z / (2 * n)) / d
+    h = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / d
+    return [max(0.0, c - h), min(1.0, c + h)]
+
+def mean_ci(values, mean, z=Z95):
+    """Normal approximation interval for the mean of values."""
+    n = len(values)
+    if n < 2:
+        return [mean, mean]
+    var = sum((v - mean) ** 2 for v in values) / (n - 1)
+    h = z * math.sqrt(var / n)
+    return [mean - h, mean + h]
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] <bot command>...")
+    parser.add_option("-m", "--map", dest="maps", action="append", default=[],
+                      help="map file to play (default: every map in maps/)")
+    parser.add_option("-r", "--rounds", type="int", default=1000,
+                      help="rounds per game (default: %default)")
+    parser.add_option("-n", "--players", type="int", default=2,
+                      help="bots per game (default: %default)")
+    parser.add_option("--swiss", type="int", default=0, metavar="N",
+                      help="play N Swiss rounds instead of a round-robin")
+    parser.add_option("--repeat", type="int", default=1,
+                      help="games per map and seat order (default: %default)")
+    parser.add_option("-j", "--processes", type="int", default=None,
+                      help="worker processes (default: one per CPU)")
+    parser.add_option("-s", "--seed", type="int", default=0,
+                      help="seed of the first match (default: %default)")
+    parser.add_option("-o", "--output", default=None,
+                      help="write the results to this file instead of stdout")
+    parser.add_option("-q", "--quiet", action="store_true", default=False,
+                      help="discard bot stderr output")
+    parser.add_option("--record", default=None, metavar="DIR",
+                      help="save a replay of every game in this directory")
+    opts, entrants = parser.parse_args()
+    if len(entrants) < opts.players:
+        parser.error("at least %d bots are required" % opts.players)
+    if len(set(entrants)) != len(entrants):
+        parser.error("bot commands must be unique")
+    maps = opts.maps or all_maps()
+
+    if opts.record is not None and not os.path.isdir(opts.record):
+        os.makedirs(opts.record)
+    t = Tournament(entrants, opts.rounds, opts.seed, opts.processes, opts.quiet,
+                   opts.record)
+    if opts.swiss:
+        # Each Swiss round is paired from the standings of the previous one,
+        # so only the games within a round run in parallel. Entrants that
+        # already met are kept apart while others are available.
+        played = set()
+        for i in xrange(opts.swiss):
+            schedule = []
+            for group in swiss_pairing(t.points(), opts.players, played):
+                played.update(frozenset(pair)
+                              for pair in itertools.combinations(group, 2))
+                schedule.extend(expand(group, maps, opts.repeat))
+            t.run(schedule)
+    else:
+        t.run(round_robin(entrants, maps, opts.players, opts.repeat))
+
+    out = json.dumps({
+        "rounds": opts.rounds,
+        "standings": t.standings(),
+        "games": t.results,
+    }, indent=1)
+    if opts.output is None:
+        print out
+    else:
+        with open(opts.output, "w") as fd:
+            fd.write(out + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/python
+
+# K independent games on one map, kept in stacked NumPy arrays and played
+# together, to collect reinforcement learning experience without bots,
+# pipes or JSON. The rules are those of engine.Game: each step() plays one
+# turn of the current player in every game, with pre_round and post_round
+# run at the round boundaries. Actions and observations use the layout of
+# IronBot mk3 (mark3/ironbot.py), sized by mk3_n_actions and mk3_state_size
+# as in its get_n_actions and get_state_len, so its agent can be trained
+# here and then play real games unchanged.
+#
+# Energy grids, player and lighthouse state are updated for all games at
+# once. Attacks, connections and lighthouse losses touch a few lighthouses
+# of a few games and are applied game by game.
+
+import time, optparse
+import numpy
+import engine, geom
+
+# mk3 moves, as (dy, dx) on the map array.
+MOVES = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+# mk3 goes towards a lighthouse with min() over a dict keyed by MOVES, so a
+# tie goes to the first of the tied moves in that dict's iteration order.
+TIE_ORDER = list(dict((move, None) for move in MOVES))
+UNREACHABLE = 999
+
+def mk3_n_actions(nl):
+    """Size of mk3's action layout on a map with nl lighthouses: 8 moves,
+    attack, go to each lighthouse, connect to each lighthouse."""
+    return 8 + 1 + 2 * nl
+
+def mk3_state_size(nl):
+    """Length of mk3's state vector on a map with nl lighthouses."""
+    return 49 + 1 + 5 * nl
+
+def mk3_lighthouses(lighthouses):
+    """Lighthouse (x, y) positions in the order of mk3's lh_dist_maps."""
+    return [(x, y) for y, x in dict(((y, x), None) for x, y in lighthouses)]
+
+def dist_map(island, pos):
+    """mk3 walking distance from pos to every cell, indexed [y, x]."""
+    h, w = len(island), len(island[0])
+    dist = numpy.ones((h, w)) * UNREACHABLE
+    seen = numpy.array(island, dtype=bool)
+    x, y = pos
+    seen[y, x] = False
+    points = [(y, x)]
+    d = 0
+    while points:
+        next_points = []
+        for y, x in points:
+            dist[y, x] = d
+            for dy, dx in MOVES:
+                if seen[y + dy, x + dx]:
+                    seen[y + dy, x + dx] = False
+                    next_points.append((y + dy, x + dx))
+        points = next_points
+        d += 1
+    return dist
+
+class VecGame(object):
+    def __init__(self, cfg, k, numplayers=None):
+        template = engine.Game(cfg, numplayers, vectorized=True)
+        self.template = template
+        self.k = k
+        self.nplayers = len(template.players)
+        self.init_pos = numpy.array([player.pos for player in template.players])
+        self.mask = numpy.array(cfg.island, dtype=int)
+        self.h, self.w = self.mask.shape
+        self.growth = template._growth
+        self.lighthouses = mk3_lighthouses(template.lighthouses)
+        self.nl = len(self.lighthouses)
+        self.lh_at = numpy.zeros((self.h, self.w), dtype=int) - 1
+        for i, (x, y) in enumerate(self.lighthouses):
+            self.lh_at[y, x] = i
+        self.dist = numpy.array([dist_map(cfg.island, pos) for pos in self.lighthouses])
+        self.n_actions = mk3_n_actions(self.nl)
+        self.state_size = mk3_state_size(self.nl)
+
+        horizon = template.island.HORIZON
+        dy, dx = numpy.mgrid[-horizon:horizon+1, -horizon:horizon+1]
+        self._view_dy = dy.ravel()
+        self._view_dx = dx.ravel()
+        self._horizon = numpy.array(template.island._horizonmap, dtype=bool).ravel()
+        self._moves = numpy.array(TIE_ORDER)
+        self._tri_cells = {}
+        self.reset()
+
+    def reset(self):
+        """Restart all games. Returns the observations of player 0."""
+        k, n, nl = self.k, self.nplayers, self.nl
+        self.energy = numpy.zeros((k, self.h, self.w), dtype=int)
+        self.pos = numpy.tile(self.init_pos, (k, 1, 1))
+        self.penergy = numpy.zeros((k, n), dtype=int)
+        self.score = numpy.zeros((k, n), dtype=int)
+        self.score_rate = numpy.zeros((k, n), dtype=int)
+        self.keys = numpy.zeros((k, n, nl), dtype=bool)
+        self.owner = numpy.zeros((k, nl), dtype=int) - 1
+        self.lh_energy = numpy.zeros((k, nl), dtype=int)
+        self.adj = numpy.zeros((k, nl, nl), dtype=bool)
+        self.segments = []
+        for i in xrange(k):
+            segments = geom.SegmentIndex()
+            for pos in self.lighthouses:
+                segments.add_point(pos)
+            self.segments.append(segments)
+        self.round = 0
+        self.turn = 0
+        self._pre_round()
+        return self.observe(0)
+
+    def step(self, actions):
+        """Play actions[i] for the current player of game i. Returns the
+        observations of the next player to move and whether each action
+        was valid."""
+        actions = numpy.asarray(actions)
+        p = self.turn
+        ok = numpy.ones(self.k, dtype=bool)
+
+        x, y = self.pos[:, p, 0], self.pos[:, p, 1]
+        delta = numpy.zeros((self.k, 2), dtype=int)
+        moving = actions < 8
+        delta[moving] = numpy.array(MOVES)[actions[moving]][:, ::-1]
+        to_lh = (actions >= 9) & (actions < 9 + self.nl)
+        if to_lh.any():
+            l = actions[to_lh] - 9
+            ty = y[to_lh][:, None] + self._moves[:, 0]
+            tx = x[to_lh][:, None] + self._moves[:, 1]
+            d = self.dist[l[:, None], ty, tx]
+            delta[to_lh] = self._moves[d.argmin(axis=1)][:, ::-1]
+        walk = moving | to_lh
+        if walk.any():
+            nx = x + delta[:, 0]
+            ny = y + delta[:, 1]
+            valid = self.mask[ny, nx] != 0
+            go = walk & valid
+            self.pos[go, p, 0] = nx[go]
+            self.pos[go, p, 1] = ny[go]
+            ok[walk & ~valid] = False
+
+        here = self.lh_at[y, x]
+        for i in numpy.flatnonzero(actions == 8):
+            if here[i] < 0:
+                ok[i] = False
+            else:
+                self._attack(i, p, here[i])
+        for i in numpy.flatnonzero(actions >= 9 + self.nl):
+            ok[i] = self._connect(i, p, here[i], actions[i] - 9 - self.nl)
+
+        self.turn += 1
+        if self.turn == self.nplayers:
+            self.score += self.score_rate
+            self.round += 1
+            self.turn = 0
+            self._pre_round()
+        return self.observe(self.turn), ok
+
+    def observe(self, p):
+        """mk3 state vectors of player p in every game, shape (k, state_size)."""
+        k = self.k
+        x, y = self.pos[:, p, 0], self.pos[:, p, 1]
+        vy = y[:, None] + self._view_dy
+        vx = x[:, None] + self._view_dx
+        inside = (vy >= 0) & (vy < self.h) & (vx >= 0) & (vx < self.w)
+        view = self.energy[numpy.arange(k)[:, None],
+                           vy.clip(0, self.h - 1), vx.clip(0, self.w - 1)]
+        view = numpy.where(inside, view, 0)
+        view = numpy.where(self._horizon, view, -1)
+        lhs = numpy.empty((k, self.nl, 5))
+        lhs[:, :, 0] = self.lh_energy
+        lhs[:, :, 1] = self.keys[:, p]
+        lhs[:, :, 2] = self.owner == p
+        lhs[:, :, 3] = self.adj.sum(axis=2)
+        lhs[:, :, 4] = self.dist[:, y, x].T
+        return numpy.concatenate((view, self.penergy[:, p, None],
+                                  lhs.reshape(k, -1)), axis=1).astype(float)
+
+    def _pre_round(self):
+        e = self.energy
+        e += self.growth
+        numpy.minimum(e, engine.Island.MAX_ENERGY, out=e)
+        e *= self.mask
+        k = numpy.arange(self.k)[:, None]
+        x, y = self.pos[:, :, 0], self.pos[:, :, 1]
+        here = self.lh_at[y, x]
+        gi, pi = numpy.nonzero(here >= 0)
+        self.keys[gi, pi, here[gi, pi]] = True
+        same = (self.pos[:, :, None, :] == self.pos[:, None, :, :]).all(axis=3)
+        self.penergy += e[k, y, x] // same.sum(axis=2)
+        e[k, y, x] = 0
+        self._decay(numpy.ones((self.k, self.nl), dtype=bool), 10)
+
+    def _decay(self, which, by):
+        self.lh_energy[which] -= by
+        dead = which & (self.lh_energy <= 0)
+        self.lh_energy[dead] = 0
+        for i, l in zip(*numpy.nonzero(dead & (self.owner >= 0))):
+            self.score_rate[i, self.owner[i, l]] -= 2
+            self._disconnect(i, l)
+        self.owner[dead] = -1
+
+    def _cells(self, a, b, c):
+        key = tuple(sorted((a, b, c)))
+        if key not in self._tri_cells:
+            tri = tuple(self.lighthouses[j] for j in key)
+            self._tri_cells[key] = len(self.template._tri_cells(tri))
+        return self._tri_cells[key]
+
+    def _disconnect(self, i, l):
+        adj = self.adj[i]
+        rate = 0
+        others = numpy.flatnonzero(adj[l])
+        for j, b in enumerate(others):
+            rate += 2
+            self.segments[i].remove(self.lighthouses[l], self.lighthouses[b])
+            for c in others[j+1:]:
+                if adj[b, c]:
+                    rate += self._cells(l, b, c)
+        self.score_rate[i, self.owner[i, l]] -= rate
+        adj[l, :] = False
+        adj[:, l] = False
+
+    def _attack(self, i, p, l):
+        strength = self.penergy[i, p]
+        self.penergy[i, p] = 0
+        owner = self.owner[i, l]
+        if owner >= 0 and owner != p:
+            d = min(self.lh_energy[i, l], strength)
+            which = numpy.zeros((self.k, self.nl), dtype=bool)
+            which[i, l] = True
+            self._decay(which, d)
+            strength -= d
+        if strength:
+            if self.owner[i, l] != p:
+                self.score_rate[i, p] += 2
+            self.owner[i, l] = p
+            self.lh_energy[i, l] += strength
+
+    def _connect(self, i, p, orig, dest):
+        # Same checks, in the same order, as Game.connect.
+        if orig < 0 or self.owner[i, orig] != p or self.owner[i, dest] != p:
+            return False
+        if not self.keys[i, p, dest] or orig == dest or self.adj[i, orig, dest]:
+            return False
+        a, b = self.lighthouses[orig], self.lighthouses[dest]
+        segments = self.segments[i]
+        if segments.hits_point(a, b) or segments.crosses(a, b):
+            return False
+        self.keys[i, p, dest] = False
+        segments.add(a, b)
+        adj = self.adj[i]
+        rate = 2
+        for c in numpy.flatnonzero(adj[orig] & adj[dest]):
+            rate += self._cells(orig, dest, c)
+        adj[orig, dest] = adj[dest, orig] = True
+        self.score_rate[i, p] += rate
+        return True
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] <map>")
+    parser.add_option("-k", "--games", type="int", default=256,
+                      help="games played at once (default: %default)")
+    parser.add_option("-r", "--rounds", type="int", default=200,
+                      help="rounds to play (default: %default)")
+    opts, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error("a map is required")
+
+    vg = VecGame(engine.GameConfig(args[0]), opts.games)
+    rng = numpy.random.RandomState(0)
+    turns = opts.rounds * vg.nplayers
+    st = time.time()
+    for i in xrange(turns):
+        vg.step(rng.randint(vg.n_actions, size=vg.k))
+    elapsed = time.time() - st
+    print "%d games x %d turns: %.0f turns/s" % (vg.k, turns, vg.k * turns / elapsed)
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,15 @@ class GameView(object):
         self.fh = self.game.island.h * CELL * self.scale
         self.arena = pygame.Surface((self.fw, self.fh), 0, self.screen)
         self.nh = self.game.island.h - 1
+        # What is currently drawn on the arena, to find the cells that
+        # changed since the last update. Energy changes come from the
+        # island itself (Island.track_changes).
+        self._island = None
+        self._shade = {}
+        self._posmap = {}
+        self._lh_owners = {}
+        self._tri_owners = {}
+        self._overlay = {}
 
     def _afill(self, (x0, y0), (w, h), c):
         x0 *= self.scale
@@ -33,12 +42,14 @@ class GameView(object):
         self.arena.fill(c, (x0, y0, w, h))
 
     def _aaline(self, (x0, y0), (x1, y1), c):
+        # Lines go on the screen over the blitted arena, so redrawing a
+        # cell never has to repair the lines crossing it.
         x0 *= self.scale
         y0 *= self.scale
         x1 *= self.scale
         y1 *= self.scale
         for i in xrange(self.scale):
-            pygame.draw.aaline(self.arena, c, (x0+i, y0+i), (x1+i, y1+i))
+            pygame.draw.aaline(self.screen, c, (x0+i, y0+i), (x1+i, y1+i))
 
     def _diamond(self, (cx, cy), size, c, width=0):
         cx *= self.scale
@@ -60,21 +71,22 @@ class GameView(object):
                 int(g2 * a + g1 * (1-a)),
                 int(b2 * a + b1 * (1-a)))
 
+    def shade(self, cell):
+        return int(self.game.island.energy[cell] / 100.0 * 25)
+
     def draw_cell(self, (cx, cy)):
         py = (self.nh - cy) * CELL
         px = cx * CELL
-        c = int(self.game.island.energy[cx, cy] / 100.0 * 25)
+        c = self._shade[cx, cy] = self.shade((cx, cy))
         bg = tuple(map(int,(25+c*0.8, 25+c*0.8, 25+c)))
 
-        for vertices, fill in self.game.tris.iteritems():
-            if (cx, cy) in fill:
-                owner = self.game.lighthouses[vertices[0]].owner
-                bg = self.calpha(bg, PLAYERC[owner], 0.15)
+        for owner in self._overlay.get((cx, cy), ()):
+            bg = self.calpha(bg, PLAYERC[owner], 0.15)
 
         self._afill((px, py), (CELL, CELL), bg)
         self._afill((px + CELL/2, py + CELL/2), (1,1), (255,255,255))
 
-        cplayers = [i for i in self.game.players if i.pos == (cx, cy)]
+        cplayers = [self.game.players[i] for i in self._posmap.get((cx, cy), ())]
         if cplayers:
             nx = int(math.ceil(math.sqrt(len(cplayers))))
             wx = 12 / nx
@@ -94,17 +106,65 @@ class GameView(object):
                 color = PLAYERC[lh.owner]
             self._diamond((px + CELL/2, py + CELL/2), 4, color, 0)
 
+    def _build_overlay(self):
+        # cell -> owners of the triangles covering it, in tris order
+        overlay = {}
+        for vertices, fill in self.game.tris.iteritems():
+            owner = self._tri_owners[vertices]
+            for cell in fill:
+                overlay.setdefault(cell, []).append(owner)
+        return overlay
+
+    def _dirty(self):
+        # Cells whose energy changed: grown, drained by a player, or set
+        # by a replay seek or a stream message. Only those whose shade
+        # changed need drawing.
+        dirty = set(cell for cell in self._island.take_changes()
+                    if self._shade.get(cell) != self.shade(cell))
+
+        posmap = {}
+        for player in self.game.players:
+            posmap.setdefault(player.pos, []).append(player.num)
+        for pos in set(posmap) | set(self._posmap):
+            if posmap.get(pos) != self._posmap.get(pos):
+                dirty.add(pos)
+        self._posmap = posmap
+
+        for pos, lh in self.game.lighthouses.iteritems():
+            if self._lh_owners.get(pos) != lh.owner:
+                dirty.add(pos)
+                self._lh_owners[pos] = lh.owner
+
+        tri_owners = dict((vertices, self.game.lighthouses[vertices[0]].owner)
+                          for vertices in self.game.tris)
+        if tri_owners != self._tri_owners:
+            self._tri_owners = tri_owners
+            overlay = self._build_overlay()
+            for cell in set(overlay) | set(self._overlay):
+                if overlay.get(cell) != self._overlay.get(cell):
+                    dirty.add(cell)
+            self._overlay = overlay
+
+        return dirty
+
     def update(self):
-        self.arena.fill((0, 0, 0))
-        for cy in xrange(self.game.island.h):
-            for cx in xrange(self.game.island.w):
-                if self.game.island[cx, cy]:
-                    self.draw_cell((cx, cy))
+        if self.game.island is not self._island:
+            self._island = self.game.island
+            self._island.track_changes()
+            self._dirty()
+            self.arena.fill((0, 0, 0))
+            dirty = [(cx, cy) for cy in xrange(self.game.island.h)
+                     for cx in xrange(self.game.island.w)]
+        else:
+            dirty = self._dirty()
+        for cell in dirty:
+            if self.game.island[cell]:
+                self.draw_cell(cell)
+        self.screen.blit(self.arena, (0,0))
         for (x0, y0), (x1, y1) in self.game.conns:
             owner = self.game.lighthouses[x0, y0].owner
             color = PLAYERC[owner]
             y0, y1 = self.nh - y0, self.nh - y1
             self._aaline((x0 * CELL + CELL/2, y0 * CELL + CELL/2),
                         (x1 * CELL + CELL/2, y1 * CELL + CELL/2), color)
-        self.screen.blit(self.arena, (0,0))
         pygame.display.flip()
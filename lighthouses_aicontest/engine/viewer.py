@@ -0,0 +1,67 @@
+#!/usr/bin/python
+
+# Spectator process: reads the state stream (see stream.py) on stdin and
+# draws it with GameView at no more than --fps frames per second. Every
+# message is applied, but only the latest state is drawn, so intermediate
+# frames are skipped when the game runs faster than the display.
+
+import sys, os, time, select, json, optparse
+import pygame
+import stream, view
+
+READ_SIZE = 65536
+
+def caption(game):
+    return "Round %s - %s" % (game.round, "  ".join(
+        "%s: %d" % (player.name, player.score) for player in game.players))
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] < stream")
+    parser.add_option("--fps", type="float", default=30,
+                      help="maximum frames per second (default: %default)")
+    opts, args = parser.parse_args()
+
+    fd = sys.stdin.fileno()
+    game = stream.Mirror()
+    gameview = None
+    buf = ""
+    eof = False
+    changed = False
+    next_frame = 0
+    while True:
+        timeout = 0.1
+        if changed:
+            timeout = max(0, next_frame - time.time())
+        if eof:
+            time.sleep(timeout)
+        elif select.select([fd], [], [], timeout)[0]:
+            data = os.read(fd, READ_SIZE)
+            if not data:
+                eof = True
+            buf += data
+            lines = buf.split("\n")
+            buf = lines.pop()
+            for line in lines:
+                game.apply(json.loads(line))
+                changed = True
+
+        if gameview is None:
+            if game.island is None:
+                if eof:
+                    return
+                continue
+            gameview = view.GameView(game)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return
+        if changed and time.time() >= next_frame:
+            gameview.update()
+            pygame.display.set_caption(caption(game))
+            changed = False
+            next_frame = time.time() + 1.0 / opts.fps
+        elif eof and not changed:
+            # The game is over and its final state has been drawn.
+            return
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-import sys, json
+import sys, os, json
+
+# Semilla de la partida, puesta por engine/tournament.py (ironlib/seeding.py).
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "..", ".."))
+from ironlib import seeding
 
 # ==============================================================================
 # ROBOT
@@ -114,6 +119,7 @@ class Interface(object):
         sys.stdout.flush()
 
     def run(self):
+        seeding.seed_from_env()
         init = self._recv()
         self.bot = self.bot_class(init)
         self._send({"name": self.bot.NAME})
@@ -16,10 +16,14 @@
 #     You should have received a copy of the GNU General Public License
 #     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import sys
 import json
 import random
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ironlib import connections, distfield, seeding
+
 HORIZON = 3
 
 
@@ -33,16 +37,7 @@ class IronBot(object):
         :return:
         """
         init_state = self._recv()
-        self.player_num = init_state["player_num"]
-        self.player_count = init_state["player_count"]
-        self.init_pos = init_state["position"]
-        self.map = init_state["map"]
-        self.lighthouses = map(tuple, init_state["lighthouses"])
-
-        self.lh_dist_maps = {
-            lh: self.get_lh_dist_map(lh, init_state["map"])
-            for lh in self.lighthouses
-        }
+        self.initialize(init_state)
         self._send({
             "name": self.NAME
         })
@@ -52,8 +47,35 @@ class IronBot(object):
             self._send(move)
             status = self._recv()
             if not status["success"]:
-                self.log("Recibido error: %s", status["message"])
-                self.log("Jugada previa: %r", move)
+                self.error(status["message"], move)
+
+    def initialize(self, init_state):
+        """
+        Save the initial game info
+        :param init_state:
+        :return:
+        """
+        self.player_num = init_state["player_num"]
+        self.player_count = init_state["player_count"]
+        self.init_pos = init_state["position"]
+        self.map = init_state["map"]
+        self.lighthouses = map(tuple, init_state["lighthouses"])
+
+        self.conn_cache = connections.ConnectionCache(self.lighthouses)
+        self.lh_dist_maps = dict(zip(
+            self.lighthouses,
+            distfield.dist_fields(init_state["map"], self.lighthouses, 999)
+        ))
+
+    def error(self, message, last_move):
+        """
+        Called when the previous move was not valid
+        :param message:
+        :param last_move:
+        :return:
+        """
+        self.log("Recibido error: %s", message)
+        self.log("Jugada previa: %r", last_move)
 
     def log(self, message, *args):
         """
@@ -80,80 +102,6 @@ class IronBot(object):
         return moves
 
       
-    def get_possible_points(self, pos, lh_map):
-        """
-
-        :param pos:
-        :param lh_map:
-        :return:
-        """
-        # Mover aleatoriamente
-        moves = ((-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1))
-
-        # Determinar movimientos válidos
-        cx, cy = pos
-
-        points = [(cx+x,cy+y) for x,y in moves if lh_map[cy+y][cx+x]==-1]
-        return points
-        
-    def get_lh_dist_map(self, lh, world_map):
-        """
-
-        :param lh:
-        :param world_map:
-        :return:
-        """
-        lh_map = [[-1 if pos else 999 for pos in row] for row in world_map]
-        lh_map[lh[1]][lh[0]] = 0
-        dist = 1
-        points = self.get_possible_points(lh, lh_map)
-        while len(points):
-            next_points = []
-            for x,y in points:
-                lh_map[y][x] = dist
-
-            for x,y in points:
-                cur_points = self.get_possible_points((x, y), lh_map)
-                next_points.extend(cur_points)
-            points = list(set(next_points))
-            dist += 1
-
-        lh_map = [[999 if pos==-1 else pos for pos in row] for row in lh_map]
-
-        return lh_map
-    
-    def are_lhs(self, orig, dest):
-        """
-
-        :param orig:
-        :param dest:
-        :return:
-        """
-        x0, x1 = sorted((orig[0], dest[0]))
-        y0, y1 = sorted((orig[1], dest[1]))
-        for lh in self.lighthouses:
-            if (x0 <= lh[0] <= x1 and y0 <= lh[1] <= y1 and
-                lh not in (orig, dest) and
-                IronBot.colinear(orig, dest, lh)):
-                return True
-        return False
-                
-         
-    def are_connections(self, lighthouses, orig, dest):
-        """
-
-        :param lighthouses:
-        :param orig:
-        :param dest:
-        :return:
-        """
-        for lh in self.lighthouses:
-            for c in lighthouses[lh]["connections"]:
-                if IronBot.intersect((lighthouses[lh]["position"], tuple(c)),
-                                     (orig, dest)):
-                    return True
-        return False
-
     def harvest_movement(self, view, my_pos):
         """
 
@@ -260,11 +208,9 @@ class IronBot(object):
             # No conectar si la conexión se cruza.
             if (dest != orig and
                 lighthouses[dest]["have_key"] and
-                list(orig) not in \
-                    lighthouses[dest]["connections"] and
+                not self.conn_cache.connected(orig, dest) and
                 lighthouses[dest]["owner"] == self.player_num and
-                not self.are_lhs(orig, dest) and
-                not self.are_connections(lighthouses, orig, dest)):
+                not self.conn_cache.blocked(orig, dest)):
                 possible_connections.append(dest)
         return possible_connections
 
@@ -292,6 +238,7 @@ class IronBot(object):
         my_pos = tuple(state["position"])
         lighthouses = dict((tuple(lh["position"]), lh)
                     for lh in state["lighthouses"])
+        self.conn_cache.update(lighthouses)
 
         # Si estamos en un faro...
         if my_pos in self.lighthouses:
@@ -349,43 +296,7 @@ class IronBot(object):
         sys.stdout.write(json.dumps(msg) + "\n")
         sys.stdout.flush()
 
-    @staticmethod
-    def orient2d(a, b, c):
-        """
-
-        :param a:
-        :param b:
-        :param c:
-        :return:
-        """
-        return (b[0] - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (b[1] - a[1])
-
-    @staticmethod
-    def colinear(a, b, c):
-        """
-
-        :param a:
-        :param b:
-        :param c:
-        :return:
-        """
-        return IronBot.orient2d(a, b, c) == 0
-
-    @staticmethod
-    def intersect(j, k):
-        """
-
-        :param j:
-        :param k:
-        :return:
-        """
-        j1, j2 = j
-        k1, k2 = k
-        return (
-            IronBot.orient2d(k1, k2, j1) * IronBot.orient2d(k1, k2, j2) < 0 and
-            IronBot.orient2d(j1, j2, k1) * IronBot.orient2d(j1, j2, k2) < 0)
-
-
 if __name__ == "__main__":
+    seeding.seed_from_env()
     bot = IronBot()
     bot.run()
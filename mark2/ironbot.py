@@ -16,10 +16,14 @@
 #     You should have received a copy of the GNU General Public License
 #     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import sys
 import json
 import random
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ironlib import connections, distfield, seeding
+
 
 class IronBot(object):
     """
@@ -34,16 +38,7 @@ class IronBot(object):
         :return:
         """
         init_state = self._recv()
-        self.player_num = init_state["player_num"]
-        self.player_count = init_state["player_count"]
-        self.init_pos = init_state["position"]
-        self.map = init_state["map"]
-        self.lighthouses = map(tuple, init_state["lighthouses"])
-
-        self.lh_dist_maps = {
-            lh: self.__get_lh_dist_map(lh, init_state["map"])
-            for lh in self.lighthouses
-        }
+        self.initialize(init_state)
         self._send({
             "name": self.NAME
         })
@@ -53,68 +48,45 @@ class IronBot(object):
             self._send(move)
             status = self._recv()
             if not status["success"]:
-                self.log("Recibido error: %s", status["message"])
-                self.log("Jugada previa: %r", move)
+                self.error(status["message"], move)
 
-    def log(self, message, *args):
+    def initialize(self, init_state):
         """
-        Send a message to stderr
-        :param message:
-        :param args:
+        Save the initial game info
+        :param init_state:
         :return:
         """
-        print >>sys.stderr, "[%s] %s" % (self.NAME, (message % args))
+        self.player_num = init_state["player_num"]
+        self.player_count = init_state["player_count"]
+        self.init_pos = init_state["position"]
+        self.map = init_state["map"]
+        self.lighthouses = map(tuple, init_state["lighthouses"])
 
-    def __get_lh_dist_map(self, lh, world_map):
-        """
+        self.conn_cache = connections.ConnectionCache(self.lighthouses)
+        self.lh_dist_maps = dict(zip(
+            self.lighthouses,
+            distfield.dist_fields(init_state["map"], self.lighthouses,
+                                  self.MAX_INT)
+        ))
 
-        :param lh:
-        :param world_map:
+    def error(self, message, last_move):
+        """
+        Called when the previous move was not valid
+        :param message:
+        :param last_move:
         :return:
         """
-        lh_map = [[-1 if pos else self.MAX_INT
-                   for pos in row]
-                  for row in world_map]
-        lh_map[lh[1]][lh[0]] = 0
-        dist = 1
-        points = IronBot.__get_possible_points(lh, lh_map)
-        while len(points):
-            next_points = []
-            for x, y in points:
-                lh_map[y][x] = dist
-
-            for x, y in points:
-                cur_points = IronBot.__get_possible_points((x, y), lh_map)
-                next_points.extend(cur_points)
-            points = list(set(next_points))
-            dist += 1
-
-        lh_map = [[self.MAX_INT if pos == -1 else pos
-                   for pos in row]
-                  for row in lh_map]
-
-        return lh_map
+        self.log("Recibido error: %s", message)
+        self.log("Jugada previa: %r", last_move)
 
-    @staticmethod
-    def __get_possible_points(pos, lh_map):
+    def log(self, message, *args):
         """
-
-        :param pos:
-        :param lh_map:
+        Send a message to stderr
+        :param message:
+        :param args:
         :return:
         """
-        # Random movement
-        moves = ((-1, -1), (-1, 0), (-1, 1),
-                 (0, -1), (0, 1),
-                 (1, -1), (1, 0), (1, 1))
-
-        # Possible movements
-        cx, cy = pos
-
-        points = [(cx+x, cy+y)
-                  for x, y in moves
-                  if lh_map[cy+y][cx+x] == -1]
-        return points
+        print >>sys.stderr, "[%s] %s" % (self.NAME, (message % args))
 
     def play(self, state):
         """
@@ -123,6 +95,7 @@ class IronBot(object):
         :return:
         """
         lh_states = self.__get_lh_states(state)
+        self.conn_cache.update(lh_states)
         my_pos = tuple(state["position"])
 
         if my_pos in lh_states:
@@ -331,48 +304,12 @@ class IronBot(object):
             # Do not connect if intersects
             if (dest != orig and
                     lh_states[dest]["have_key"] and
-                    list(orig) not in
-                    lh_states[dest]["connections"] and
+                    not self.conn_cache.connected(orig, dest) and
                     lh_states[dest]["owner"] == self.player_num and
-                    not IronBot.__are_lhs(orig, dest, lh_states) and
-                    not IronBot.__are_connections(lh_states, orig, dest)):
+                    not self.conn_cache.blocked(orig, dest)):
                 possible_connections.append(dest)
         return possible_connections
 
-    @staticmethod
-    def __are_lhs(orig, dest, lh_states):
-        """
-
-        :param orig:
-        :param dest:
-        :param lh_states:
-        :return:
-        """
-        x0, x1 = sorted((orig[0], dest[0]))
-        y0, y1 = sorted((orig[1], dest[1]))
-        for lh in lh_states:
-            if (x0 <= lh[0] <= x1 and y0 <= lh[1] <= y1 and
-                    lh not in (orig, dest) and
-                    IronBot.colinear(orig, dest, lh)):
-                return True
-        return False
-
-    @staticmethod
-    def __are_connections(lh_states, orig, dest):
-        """
-
-        :param lh_states:
-        :param orig:
-        :param dest:
-        :return:
-        """
-        for lh in lh_states:
-            for c in lh_states[lh]["connections"]:
-                if IronBot.intersect((lh_states[lh]["position"], tuple(c)),
-                                     (orig, dest)):
-                    return True
-        return False
-
     def __to_lh_movement(self, lh, my_pos, possible_moves):
         """
 
@@ -415,42 +352,7 @@ class IronBot(object):
         sys.stdout.write(json.dumps(msg) + "\n")
         sys.stdout.flush()
 
-    @staticmethod
-    def orient2d(a, b, c):
-        """
-
-        :param a:
-        :param b:
-        :param c:
-        :return:
-        """
-        return (b[0] - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (b[1] - a[1])
-
-    @staticmethod
-    def colinear(a, b, c):
-        """
-
-        :param a:
-        :param b:
-        :param c:
-        :return:
-        """
-        return IronBot.orient2d(a, b, c) == 0
-
-    @staticmethod
-    def intersect(j, k):
-        """
-
-        :param j:
-        :param k:
-        :return:
-        """
-        j1, j2 = j
-        k1, k2 = k
-        return (
-            IronBot.orient2d(k1, k2, j1) * IronBot.orient2d(k1, k2, j2) < 0 and
-            IronBot.orient2d(j1, j2, k1) * IronBot.orient2d(j1, j2, k2) < 0)
-
 if __name__ == "__main__":
+    seeding.seed_from_env()
     bot = IronBot()
     bot.run()
@@ -1,8 +1,10 @@
 # coding=utf-8
 import os
+import glob
+import time
+import threading
 import numpy as np
 import random
-from collections import namedtuple, deque
 
 import torch
 import torch.nn as nn
@@ -15,14 +17,21 @@ GAMMA = 0.99            # discount factor
 TAU = 1e-3              # for soft update of target parameters
 LR = 5e-4               # learning rate 
 UPDATE_EVERY = 1        # how often to update the network
+PER_ALPHA = 0.6         # prioritized replay: how much prioritization is used
+PER_BETA = 0.4          # prioritized replay: initial importance-sampling correction
+PER_BETA_STEPS = int(1e5)  # prioritized replay: samples until the correction is full
+PER_EPS = 1e-5          # prioritized replay: priority of a zero TD error
 SAVE_PATH = 'checkpoint.pth'
+CHECKPOINT_EVERY = 1000     # steps between checkpoints
+CHECKPOINT_SECONDS = 60     # or seconds between checkpoints, if sooner
+CHECKPOINT_KEEP = 3         # checkpoints kept on disk
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
 class Agent():
     """Interacts with and learns from the environment."""
 
-    def __init__(self, state_size, action_size, seed):
+    def __init__(self, state_size, action_size, seed, prioritized=False):
         """Initialize an Agent object.
         
         Params
@@ -30,6 +39,7 @@ class Agent():
             state_size (int): dimension of each state
             action_size (int): dimension of each action
             seed (int): random seed
+            prioritized (bool): use prioritized experience replay
         """
         self.state_size = state_size
         self.action_size = action_size
@@ -41,19 +51,37 @@ class Agent():
         self.optimizer = optim.Adam(self.qnetwork_local.parameters(), lr=LR)
 
         # Replay memory
-        self.memory = ReplayBuffer(action_size, BUFFER_SIZE, BATCH_SIZE, seed)
+        self.prioritized = prioritized
+        if prioritized:
+            self.memory = PrioritizedReplayBuffer(state_size, action_size, BUFFER_SIZE, BATCH_SIZE, seed)
+        else:
+            self.memory = ReplayBuffer(state_size, action_size, BUFFER_SIZE, BATCH_SIZE, seed)
         # Initialize time step (for updating every UPDATE_EVERY steps)
         self.t_step = 0
+        self.steps = 0
+        self.checkpoints = CheckpointManager(self)
     
     def step(self, state, action, reward, next_state, done):
-        # Save experience in replay memory
-        self.memory.add(state, action, reward, next_state, done)
+        self.remember(state, action, reward, next_state, done)
         
         # Learn every UPDATE_EVERY time steps.
         self.t_step = (self.t_step + 1) % UPDATE_EVERY
         if self.t_step == 0:
-            # If enough samples are available in memory, get random subset and learn
-            if len(self.memory) > BATCH_SIZE:
+            self.update()
+
+    def remember(self, state, action, reward, next_state, done):
+        """Save experience in replay memory."""
+        self.memory.add(state, action, reward, next_state, done)
+        self.steps += 1
+
+    def update(self):
+        """Learn from one minibatch, if enough samples are available."""
+        if len(self.memory) > BATCH_SIZE:
+            if self.prioritized:
+                experiences, weights, idx = self.memory.sample()
+                errors = self.learn(experiences, GAMMA, weights)
+                self.memory.update_priorities(idx, errors.cpu().numpy().ravel())
+            else:
                 experiences = self.memory.sample()
                 self.learn(experiences, GAMMA)
 
@@ -77,23 +105,63 @@ class Agent():
         else:
             return random.choice(np.arange(self.action_size))
 
+    def state_dict(self):
+        """Everything needed to resume training."""
+        return {
+            "local": self.qnetwork_local.state_dict(),
+            "target": self.qnetwork_target.state_dict(),
+            "optimizer": self.optimizer.state_dict(),
+            "t_step": self.t_step,
+            "steps": self.steps,
+        }
+
     def save(self):
-        """"""
-        torch.save(self.qnetwork_local.state_dict(), SAVE_PATH)
+        """Save a checkpoint now and wait until it is on disk."""
+        self.checkpoints.save(wait=True)
+
+    def checkpoint(self):
+        """Save a checkpoint in the background if one is due."""
+        self.checkpoints.maybe_save()
+
+    def close(self):
+        """Save the steps taken since the last checkpoint."""
+        if self.steps != self.checkpoints.last_step:
+            self.checkpoints.save()
+        self.checkpoints.wait()
 
     def load(self):
-        """"""
-        if os.path.exists(SAVE_PATH):
-            self.qnetwork_local.load_state_dict(torch.load(SAVE_PATH))
+        """Resume from the newest checkpoint, if any."""
+        paths = self.checkpoints.paths()
+        if paths:
+            path = paths[-1]
+        elif os.path.exists(SAVE_PATH):
+            path = SAVE_PATH
+        else:
+            return
+        checkpoint = torch.load(path, map_location=device)
+        if "local" not in checkpoint:
+            # Old checkpoints only have the local network; start the target
+            # network from it rather than from scratch.
+            self.qnetwork_local.load_state_dict(checkpoint)
+            self.qnetwork_target.load_state_dict(checkpoint)
+            return
+        self.qnetwork_local.load_state_dict(checkpoint["local"])
+        self.qnetwork_target.load_state_dict(checkpoint["target"])
+        self.optimizer.load_state_dict(checkpoint["optimizer"])
+        self.t_step = checkpoint["t_step"]
+        self.steps = checkpoint["steps"]
+        self.checkpoints.last_step = self.steps
 
 
-    def learn(self, experiences, gamma):
+    def learn(self, experiences, gamma, weights=None):
         """Update value parameters using given batch of experience tuples.
 
         Params
         ======
             experiences (Tuple[torch.Tensor]): tuple of (s, a, r, s', done) tuples 
             gamma (float): discount factor
+            weights (torch.Tensor): importance-sampling weight of each experience
+        Returns the TD errors of the batch.
         """
         states, actions, rewards, next_states, dones = experiences
 
@@ -106,7 +174,10 @@ class Agent():
         Q_expected = self.qnetwork_local(states).gather(1, actions)
 
         # Compute loss
-        loss = F.mse_loss(Q_expected, Q_targets)
+        if weights is None:
+            loss = F.mse_loss(Q_expected, Q_targets)
+        else:
+            loss = (weights * (Q_expected - Q_targets) ** 2).mean()
         # Minimize the loss
         self.optimizer.zero_grad()
         loss.backward()
@@ -115,6 +186,8 @@ class Agent():
         # ------------------- update target network ------------------- #
         self.soft_update(self.qnetwork_local, self.qnetwork_target, TAU)                     
 
+        return (Q_targets - Q_expected).detach()
+
     def soft_update(self, local_model, target_model, tau):
         """Soft update model parameters.
         θ_target = τ*θ_local + (1 - τ)*θ_target
@@ -129,45 +202,249 @@ class Agent():
             target_param.data.copy_(tau*local_param.data + (1.0-tau)*target_param.data)
 
 
+class CheckpointManager:
+    """Saves an Agent every `every` steps or `seconds` seconds.
+
+    The agent state is copied on the caller's thread and written by a
+    background thread to a temporary file that is then renamed into
+    place, as <path without extension>-<steps><extension>. Only the
+    `keep` newest checkpoints are kept.
+    """
+
+    def __init__(self, agent, path=SAVE_PATH, every=CHECKPOINT_EVERY,
+                 seconds=CHECKPOINT_SECONDS, keep=CHECKPOINT_KEEP):
+        self.agent = agent
+        root, self.ext = os.path.splitext(path)
+        self.prefix = root + "-"
+        self.every = every
+        self.seconds = seconds
+        self.keep = keep
+        self.last_step = agent.steps
+        self.last_time = time.time()
+        self.thread = None
+
+    def paths(self):
+        """Existing checkpoints, oldest first."""
+        found = []
+        for path in glob.glob(self.prefix + "*" + self.ext):
+            number = path[len(self.prefix):len(path) - len(self.ext)]
+            if number.isdigit():
+                found.append((int(number), path))
+        return [path for number, path in sorted(found)]
+
+    def maybe_save(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        if (self.agent.steps - self.last_step >= self.every or
+                time.time() - self.last_time >= self.seconds):
+            self.save()
+
+    def save(self, wait=False):
+        self.wait()
+        self.last_step = self.agent.steps
+        self.last_time = time.time()
+        state = _cpu_copy(self.agent.state_dict())
+        path = "%s%08d%s" % (self.prefix, self.agent.steps, self.ext)
+        self.thread = threading.Thread(target=self._write, args=(state, path))
+        self.thread.start()
+        if wait:
+            self.wait()
+
+    def _write(self, state, path):
+        tmp = path + ".tmp"
+        torch.save(state, tmp)
+        os.rename(tmp, path)
+        for old in self.paths()[:-self.keep]:
+            os.remove(old)
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+def _cpu_copy(obj):
+    """Copy of a state dict with every tensor cloned to the CPU."""
+    if torch.is_tensor(obj):
+        return obj.detach().cpu().clone()
+    if isinstance(obj, dict):
+        return type(obj)((k, _cpu_copy(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_cpu_copy(v) for v in obj)
+    return obj
+
+
 class ReplayBuffer:
-    """Fixed-size buffer to store experience tuples."""
+    """Fixed-size buffer to store experience tuples.
+
+    Experiences are kept in preallocated arrays used as a ring: add() writes
+    at a cursor and sample() gathers a batch by index array into staging
+    tensors (pinned when training on CUDA) that are reused by every call,
+    so both take the same time and memory whatever the fill level.
+    """
 
-    def __init__(self, action_size, buffer_size, batch_size, seed):
+    def __init__(self, state_size, action_size, buffer_size, batch_size, seed):
         """Initialize a ReplayBuffer object.
 
         Params
         ======
+            state_size (int): dimension of each state
             action_size (int): dimension of each action
             buffer_size (int): maximum size of buffer
             batch_size (int): size of each training batch
             seed (int): random seed
         """
         self.action_size = action_size
-        self.memory = deque(maxlen=buffer_size)
+        self.buffer_size = buffer_size
         self.batch_size = batch_size
-        self.experience = namedtuple("Experience", field_names=["state", "action", "reward", "next_state", "done"])
         self.seed = random.seed(seed)
-    
+        self.rng = np.random.RandomState(seed)
+
+        self.states = np.zeros((buffer_size, state_size), dtype=np.float32)
+        self.actions = np.zeros((buffer_size, 1), dtype=np.int64)
+        self.rewards = np.zeros((buffer_size, 1), dtype=np.float32)
+        self.next_states = np.zeros((buffer_size, state_size), dtype=np.float32)
+        self.dones = np.zeros((buffer_size, 1), dtype=np.float32)
+        self.arrays = (self.states, self.actions, self.rewards,
+                       self.next_states, self.dones)
+        self.pos = 0
+        self.size = 0
+
+        self.staging = [self._staging(array.shape[1:], array.dtype)
+                        for array in self.arrays]
+        self.views = [tensor.numpy() for tensor in self.staging]
+
+    def _staging(self, shape, dtype):
+        tensor = torch.from_numpy(np.zeros((self.batch_size,) + shape, dtype=dtype))
+        if device.type == "cuda":
+            tensor = tensor.pin_memory()
+        return tensor
+
     def add(self, state, action, reward, next_state, done):
         """Add a new experience to memory."""
-        e = self.experience(state, action, reward, next_state, done)
-        self.memory.append(e)
-    
+        i = self.pos
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self.pos = (i + 1) % self.buffer_size
+        self.size = min(self.size + 1, self.buffer_size)
+
     def sample(self):
-        """Randomly sample a batch of experiences from memory."""
-        experiences = random.sample(self.memory, k=self.batch_size)
+        """Randomly sample a batch of experiences from memory.
 
-        states = torch.from_numpy(np.vstack([e.state for e in experiences if e is not None])).float().to(device)
-        actions = torch.from_numpy(np.vstack([e.action for e in experiences if e is not None])).long().to(device)
-        rewards = torch.from_numpy(np.vstack([e.reward for e in experiences if e is not None])).float().to(device)
-        next_states = torch.from_numpy(np.vstack([e.next_state for e in experiences if e is not None])).float().to(device)
-        dones = torch.from_numpy(np.vstack([e.done for e in experiences if e is not None]).astype(np.uint8)).float().to(device)
-  
-        return (states, actions, rewards, next_states, dones)
+        The batch is drawn with replacement. On CPU the returned tensors are
+        the staging tensors, overwritten by the next call.
+        """
+        idx = self.rng.randint(0, self.size, size=self.batch_size)
+        return self._gather(idx)
+
+    def _gather(self, idx):
+        batch = []
+        for array, view, tensor in zip(self.arrays, self.views, self.staging):
+            np.take(array, idx, axis=0, out=view)
+            batch.append(tensor.to(device, non_blocking=True))
+        return tuple(batch)
 
     def __len__(self):
         """Return the current size of internal memory."""
-        return len(self.memory)
+        return self.size
+
+class SumTree:
+    """Binary tree of priority sums over a fixed number of slots.
+
+    Stored in an array: node i has children 2i and 2i+1 and the leaves
+    start at self.leaves. Updating or looking up a batch of slots visits
+    one level of the tree at a time, O(log n) NumPy operations.
+    """
+
+    def __init__(self, capacity):
+        self.leaves = 2
+        while self.leaves < capacity:
+            self.leaves *= 2
+        self.tree = np.zeros(2 * self.leaves)
+
+    def total(self):
+        return self.tree[1]
+
+    def __getitem__(self, idx):
+        return self.tree[np.asarray(idx) + self.leaves]
+
+    def update(self, idx, priorities):
+        """Set the priorities of slots idx (an array, or a single slot)."""
+        if np.isscalar(idx):
+            node = idx + self.leaves
+            tree = self.tree
+            tree[node] = priorities
+            while node > 1:
+                node //= 2
+                tree[node] = tree[2 * node] + tree[2 * node + 1]
+            return
+        nodes = np.asarray(idx) + self.leaves
+        self.tree[nodes] = priorities
+        nodes = np.unique(nodes // 2)
+        while True:
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            if nodes[0] == 1:
+                break
+            nodes = np.unique(nodes // 2)
+
+    def find(self, values):
+        """Slots whose range of cumulative priority holds each value."""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.leaves:
+            left = self.tree[2 * nodes]
+            right = values > left
+            values -= left * right
+            nodes = 2 * nodes + right
+        return nodes - self.leaves
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """ReplayBuffer that samples experiences in proportion to their TD error.
+
+    Priorities are (|TD error| + PER_EPS) ** PER_ALPHA, kept in a SumTree;
+    new experiences get the highest priority seen so far. sample() also
+    returns importance-sampling weights, whose exponent beta grows from
+    PER_BETA to 1 over PER_BETA_STEPS samples.
+    """
+
+    def __init__(self, state_size, action_size, buffer_size, batch_size, seed):
+        ReplayBuffer.__init__(self, state_size, action_size, buffer_size, batch_size, seed)
+        self.tree = SumTree(buffer_size)
+        self.max_priority = 1.0
+        self.beta = PER_BETA
+        self.weights = self._staging((1,), np.float32)
+
+    def add(self, state, action, reward, next_state, done):
+        """Add a new experience to memory."""
+        i = self.pos
+        ReplayBuffer.add(self, state, action, reward, next_state, done)
+        self.tree.update(i, self.max_priority ** PER_ALPHA)
+
+    def sample(self):
+        """Sample a batch of experiences by priority.
+
+        Returns the experiences, their importance-sampling weights and their
+        indices, to be passed to update_priorities().
+        """
+        total = self.tree.total()
+        values = (np.arange(self.batch_size) +
+                  self.rng.uniform(size=self.batch_size)) * total / self.batch_size
+        idx = np.minimum(self.tree.find(values), self.size - 1)
+        weights = (self.size * self.tree[idx] / total) ** -self.beta
+        self.weights.numpy()[:, 0] = weights / weights.max()
+        self.beta = min(1.0, self.beta + (1.0 - PER_BETA) / PER_BETA_STEPS)
+        return self._gather(idx), self.weights.to(device, non_blocking=True), idx
+
+    def update_priorities(self, idx, errors):
+        """Set the priorities of sampled experiences from their TD errors."""
+        priorities = np.abs(errors) + PER_EPS
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree.update(idx, priorities ** PER_ALPHA)
+
 
 class QNetwork(nn.Module):
     """Actor (Policy) Model."""
@@ -16,11 +16,15 @@
 #     You should have received a copy of the GNU General Public License
 #     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import sys
 import json
 import numpy as np
 from dqn_agent import Agent
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ironlib import distfield, seeding
+
 
 class IronBot(object):
     """
@@ -28,85 +32,147 @@ class IronBot(object):
     """
     NAME = "IronBot_mk3"
 
-    def __init__(self):
+    EPS_START = 1.0
+    EPS_END = 0.01
+    EPS_DECAY = 0.995
+    ERROR_REWARD = -10
+
+    def __init__(self, learn=True):
+        self.learn = learn
         self.player_num = None
         self.map = None
         self.agent = None
         self.lh_dist_maps = None
 
+        self.eps = self.EPS_START
+        self.cum_reward = 0
+        self.last_score = 0
+        self.last_state = None
+        self.last_action_i = None
+        self.last_success = True
+
     def run(self):
         """
 
         :return:
         """
         init_state = self._recv()
+        self.initialize(init_state)
+
+        self._send({
+            "name": self.NAME
+        })
+
+        try:
+            while True:
+                raw_state = self._recv()
+                action = self.play(raw_state)
+                self._send(action)
+                response = self._recv()
+                self.log("response: %s", response)
+                if response["success"]:
+                    self.success()
+                else:
+                    self.error(response["message"], action)
+        finally:
+            # The engine closes stdin at the end of the game.
+            self.close()
+
+    def close(self):
+        """
+        Save the agent's last checkpoint
+
+        :return:
+        """
+        if self.agent is not None:
+            self.agent.close()
+
+    def initialize(self, init_state):
+        """
+
+        :param init_state:
+        :return:
+        """
         self.save_init_info(init_state)
 
         self.agent = Agent(
             state_size=self.get_state_len(),
             action_size=self.get_n_actions(),
-            seed=0
+            seed=seeding.seed_from_env(default=0)
         )
         self.agent.load()
 
-        self._send({
-            "name": self.NAME
-        })
-
-        eps_end = 0.01
-        eps_decay = 0.995
-        eps = 1.0
-        cum_reward = 0
-        last_score = 0
+    def play(self, raw_state):
+        """
+        Learn from the outcome of the previous action and choose the next one
 
-        raw_state = self._recv()
+        :param raw_state:
+        :return:
+        """
         self.log("raw_state: %s", raw_state)
         position, state = self.save_state_info(raw_state)
-        while True:
-            action_i = self.agent.act(state, eps=eps)
-            self.log("action_i: %s", action_i)
 
-            current_actions = self.__get_current_actions(
-                raw_state["energy"], position
-            )
-            self.log("current_actions: %s", current_actions)
+        if self.learn and self.last_state is not None:
+            self.__learn(raw_state["score"], state)
 
-            action = current_actions[action_i]
-            self.log("action: %s", action)
+        action_i = self.agent.act(state, eps=self.eps if self.learn else 0.)
+        self.log("action_i: %s", action_i)
 
-            self._send(action)
-            response = self._recv()
-            self.log("response: %s", response)
+        current_actions = self.__get_current_actions(
+            raw_state["energy"], position
+        )
+        self.log("current_actions: %s", current_actions)
 
-            raw_state = self._recv()
-            self.log("raw_state: %s", raw_state)
-            position, next_state = self.save_state_info(
-                raw_state
-            )
+        action = current_actions[action_i]
+        self.log("action: %s", action)
 
-            score = raw_state["score"]
+        self.last_state = state
+        self.last_action_i = action_i
+        return action
 
-            if response["success"]:
-                reward = score - last_score
-            else:
-                self.log("Recibido error: %s", response["message"])
-                self.log("Jugada previa: %r", action)
-                reward = -10
-            last_score = score
-            self.log("reward: %s", reward)
-            done = False
+    def success(self):
+        """
 
-            self.agent.step(state, action_i, reward, next_state, done)
+        :return:
+        """
+        self.last_success = True
 
-            state = next_state
+    def error(self, message, last_move):
+        """
 
-            eps = max(eps_end, eps_decay * eps)  # decrease epsilon
-            self.log("eps: %s", eps)
+        :param message:
+        :param last_move:
+        :return:
+        """
+        self.log("Recibido error: %s", message)
+        self.log("Jugada previa: %r", last_move)
+        self.last_success = False
 
-            self.agent.save()
+    def __learn(self, score, next_state):
+        """
 
-            cum_reward += reward
-            self.log("cum_reward: %s", cum_reward)
+        :param score:
+        :param next_state:
+        :return:
+        """
+        if self.last_success:
+            reward = score - self.last_score
+        else:
+            reward = self.ERROR_REWARD
+        self.last_score = score
+        self.log("reward: %s", reward)
+        done = False
+
+        self.agent.step(self.last_state, self.last_action_i, reward,
+                        next_state, done)
+
+        self.eps = max(self.EPS_END, self.EPS_DECAY * self.eps)
+        self.log("eps: %s", self.eps)
+
+        self.agent.checkpoint()
+
+        self.cum_reward += reward
+        self.log("cum_reward: %s", self.cum_reward)
 
     def save_init_info(self, init_state):
         """
@@ -121,9 +187,11 @@ class IronBot(object):
         self.log("player_num: %s", self.player_num)
         self.map = np.array(init_state["map"])
         self.log("map: %s", self.map)
+        dist_maps = distfield.dist_fields(
+            init_state["map"], init_state["lighthouses"], 999)
         self.lh_dist_maps = {
-            (lh[1], lh[0]): self.__get_lh_dist_map((lh[1], lh[0]))
-            for lh in init_state["lighthouses"]
+            (lh[1], lh[0]): dist_map
+            for lh, dist_map in zip(init_state["lighthouses"], dist_maps)
         }
         self.log("lh_dist_maps: %s", self.lh_dist_maps)
 
@@ -142,34 +210,6 @@ class IronBot(object):
         self.log("state: %s", state)
         return position, state
 
-    def __get_lh_dist_map(self, lh):
-        """
-
-        :param lh:
-        :param world_map:
-        :return:
-        """
-        possible_map = np.copy(self.map)
-        lh_map = np.ones(possible_map.shape) * 999
-        dist = 0
-        points = [lh]
-        possible_map[lh] = 0
-        while len(points):
-            for x, y in points:
-                lh_map[x, y] = dist
-
-            next_points = []
-            for x, y in points:
-                for move in IronBot.__get_possible_moves(
-                        possible_map, (x, y)):
-                    point = (move[0] + x, move[1] + y)
-                    possible_map[point] = 0
-                    next_points.append(point)
-            points = next_points
-            dist += 1
-
-        return lh_map
-
     def get_state(self, raw_state, position):
         """
 
@@ -256,7 +296,7 @@ class IronBot(object):
 
         :return:
         """
-        return 8 + 1 + 1 * len(self.lh_dist_maps)
+        return 8 + 1 + 2 * len(self.lh_dist_maps)
 
     def __to_lh_movement(self, lh, position, possible_moves):
         """
@@ -299,43 +339,6 @@ class IronBot(object):
     #
     #     return closest_lhs
 
-    @staticmethod
-    def __get_possible_moves(world_map, pos):
-        """
-
-        :param pos:
-        :return:
-        """
-        # Random move
-        moves = [
-            (-1, -1),
-            (-1, 0),
-            (-1, 1),
-            (0, -1),
-            (0, 1),
-            (1, -1),
-            (1, 0),
-            (1, 1)
-        ]
-
-        moves = [
-            move
-            for move in moves
-            if IronBot.__move_is_possible(world_map, pos, move)
-        ]
-
-        return moves
-
-    @staticmethod
-    def __move_is_possible(world_map, pos, move):
-        """
-
-        :return:
-        """
-        x, y = move
-        cx, cy = pos
-        return world_map[cx + x, cy + y]
-
     def log(self, message, *args):
         """
         Send a message to stderr
@@ -368,5 +371,7 @@ class IronBot(object):
 
 
 if __name__ == "__main__":
-    bot = IronBot()
+    # With --play the bot only acts on its checkpoint, e.g. one trained
+    # with train.py, and never spends a turn on a gradient update.
+    bot = IronBot(learn="--play" not in sys.argv[1:])
     bot.run()
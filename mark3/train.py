@@ -0,0 +1,209 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+#     Copyright 2018 Ibai Roman
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Trains the mk3 agent with several actor processes and one learner:
+#
+#   python2.7 mark3/train.py -j 7 maps/grid.txt py:examples/RandBot/randbot.py:RandBot
+#
+# Each actor plays games in-process (engine/env.py) with a frozen copy of
+# the QNetwork and sends its transitions to the learner in chunks. The
+# learner keeps the replay memory, trains the Agent, and every --sync
+# updates copies its weights into a shared-memory QNetwork that the actors
+# reload between moves. Checkpoints are written as when IronBot trains
+# while playing, so mark3/ironbot.py resumes from them.
+
+import os
+import sys
+import time
+import random
+import optparse
+import multiprocessing
+from Queue import Empty
+import numpy as np
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "lighthouses_aicontest", "engine"))
+import env
+from dqn_agent import Agent, QNetwork
+from ironbot import IronBot
+
+CHUNK = 64          # transitions per message to the learner
+QUEUE_CHUNKS = 64   # messages waiting for the learner before actors block
+EPS_BASE = 0.4      # actor i explores with EPS_BASE ** (1 + EPS_SPREAD * i / (n - 1))
+EPS_SPREAD = 7
+
+
+def actor_eps(i, n):
+    """Exploration rate of actor i of n: a few explore a lot, most little."""
+    if n == 1:
+        return EPS_BASE
+    return EPS_BASE ** (1 + EPS_SPREAD * float(i) / (n - 1))
+
+
+def run_actor(i, n, opts, args, shared, version, lock, queue, stop):
+    """Play games with the shared weights and send transitions to queue."""
+    torch.set_num_threads(1)
+    seed = opts.seed + 1 + i
+    random.seed(seed)
+    np.random.seed(seed)
+    eps = actor_eps(i, n)
+
+    game = env.LighthouseEnv(opts.rounds, vectorized=opts.vectorized)
+    state = game.reset(args[0], args[1:])
+    action_size = game.n_actions
+    net = QNetwork(game.state_size, action_size, seed)
+    net.eval()
+    seen = -1
+    chunk = []
+    score = 0
+    while not stop.is_set():
+        if version.value != seen:
+            with lock:
+                net.load_state_dict(shared.state_dict())
+                seen = version.value
+
+        if random.random() > eps:
+            with torch.no_grad():
+                values = net(torch.from_numpy(state).float().unsqueeze(0))
+            action = int(values.argmax())
+        else:
+            action = random.randrange(action_size)
+        next_state, reward, done, status = game.step(action)
+        score += reward
+        if not status["success"]:
+            reward = IronBot.ERROR_REWARD
+        chunk.append((state, action, reward, next_state, done))
+        state = next_state
+
+        if done:
+            queue.put(("episode", i, score))
+            state = game.reset(args[0], args[1:])
+            score = 0
+        if len(chunk) >= CHUNK:
+            queue.put(("transitions", i, chunk))
+            chunk = []
+
+
+def train(opts, args):
+    probe = env.LighthouseEnv(1)
+    probe.reset(args[0], args[1:])
+    state_size = probe.state_size
+    action_size = probe.n_actions
+    layout = IronBot(learn=False)
+    layout.lh_dist_maps = dict.fromkeys(probe.lighthouses)
+    if (layout.get_state_len(), layout.get_n_actions()) != (state_size, action_size):
+        raise ValueError("env.py and IronBot disagree on the state/action sizes")
+
+    agent = Agent(state_size, action_size, seed=opts.seed,
+                  prioritized=opts.prioritized)
+    agent.load()
+    shared = QNetwork(state_size, action_size, opts.seed)
+    shared.load_state_dict(agent.qnetwork_local.state_dict())
+    shared.share_memory()
+    version = multiprocessing.Value("i", 0)
+    lock = multiprocessing.Lock()
+    queue = multiprocessing.Queue(QUEUE_CHUNKS)
+    stop = multiprocessing.Event()
+
+    actors = []
+    for i in xrange(opts.actors):
+        p = multiprocessing.Process(
+            target=run_actor,
+            args=(i, opts.actors, opts, args, shared, version, lock, queue, stop))
+        p.daemon = True
+        p.start()
+        actors.append(p)
+
+    start = time.time()
+    last_log = start
+    updates = 0
+    owed = 0.0
+    transitions = 0
+    scores = []
+    try:
+        while updates < opts.updates:
+            kind, i, data = queue.get()
+            if kind == "episode":
+                scores.append(data)
+                continue
+
+            for state, action, reward, next_state, done in data:
+                agent.remember(state, action, reward, next_state, done)
+            transitions += len(data)
+            owed += len(data) * opts.replay_ratio
+            while owed >= 1 and updates < opts.updates:
+                agent.update()
+                owed -= 1
+                updates += 1
+                if updates % opts.sync == 0:
+                    with lock:
+                        shared.load_state_dict(agent.qnetwork_local.state_dict())
+                        version.value += 1
+            agent.checkpoint()
+
+            now = time.time()
+            if now - last_log >= opts.log_every:
+                last_log = now
+                elapsed = now - start
+                mean = np.mean(scores[-opts.actors:]) if scores else 0
+                print "%d updates, %d transitions (%.0f/s), %d episodes, mean score %.1f" % (
+                    updates, transitions, transitions / elapsed, len(scores), mean)
+                sys.stdout.flush()
+    finally:
+        stop.set()
+        # Actors may be blocked on a full queue: drain it until they exit.
+        while any(p.is_alive() for p in actors):
+            try:
+                queue.get(timeout=0.1)
+            except Empty:
+                pass
+        for p in actors:
+            p.join()
+        agent.close()
+
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] <map> <opponent spec>...")
+    parser.add_option("-j", "--actors", type="int",
+                      default=max(1, multiprocessing.cpu_count() - 1),
+                      help="actor processes (default: %default)")
+    parser.add_option("-u", "--updates", type="int", default=100000,
+                      help="learner updates to run (default: %default)")
+    parser.add_option("-r", "--rounds", type="int", default=1000,
+                      help="rounds per episode (default: %default)")
+    parser.add_option("--replay-ratio", type="float", default=0.25,
+                      help="learner updates per transition (default: %default)")
+    parser.add_option("--sync", type="int", default=200,
+                      help="updates between weight broadcasts (default: %default)")
+    parser.add_option("--prioritized", action="store_true", default=False,
+                      help="use prioritized experience replay")
+    parser.add_option("--vectorized", action="store_true", default=False,
+                      help="use the NumPy energy field")
+    parser.add_option("--seed", type="int", default=0,
+                      help="random seed (default: %default)")
+    parser.add_option("--log-every", type="float", default=10,
+                      help="seconds between progress lines (default: %default)")
+    opts, args = parser.parse_args()
+    if len(args) < 2:
+        parser.error("a map and at least one opponent are required")
+    train(opts, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,17 +16,26 @@
 #     You should have received a copy of the GNU General Public License
 #     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import sys
 import json
+import time
 import random
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ironlib import connections, distfield, seeding, tour, triangles
+
 
 class IronBot(object):
     """
     IronBot mk4
     """
     NAME = "IronBot_mk4"
-    MAX_INT = 1e40
+    MAX_INT = sys.maxint
+    MOVE_TIMEOUT = 0.1      # engine's soft move time limit, unless sent
+    TIME_SHARE = 0.5        # part of it play() may spend
+    # (depth, width) of the successive tour searches, while time is left
+    PLAN_SCHEDULE = ((3, 16), (4, 32), (5, 64), (6, 128))
 
     def run(self):
         """
@@ -34,16 +43,7 @@ class IronBot(object):
         :return:
         """
         init_state = self._recv()
-        self.player_num = init_state["player_num"]
-        self.player_count = init_state["player_count"]
-        self.init_pos = init_state["position"]
-        self.map = init_state["map"]
-        self.lighthouses = map(tuple, init_state["lighthouses"])
-
-        self.lh_dist_maps = {
-            lh: self.__get_lh_dist_map(lh, init_state["map"])
-            for lh in self.lighthouses
-        }
+        self.initialize(init_state)
         self._send({
             "name": self.NAME
         })
@@ -53,68 +53,48 @@ class IronBot(object):
             self._send(move)
             status = self._recv()
             if not status["success"]:
-                self.log("Recibido error: %s", status["message"])
-                self.log("Jugada previa: %r", move)
+                self.error(status["message"], move)
 
-    def log(self, message, *args):
+    def initialize(self, init_state):
         """
-        Send a message to stderr
-        :param message:
-        :param args:
+        Save the initial game info
+        :param init_state:
         :return:
         """
-        print >>sys.stderr, "[%s] %s" % (self.NAME, (message % args))
+        self.player_num = init_state["player_num"]
+        self.player_count = init_state["player_count"]
+        self.init_pos = init_state["position"]
+        self.map = init_state["map"]
+        self.lighthouses = map(tuple, init_state["lighthouses"])
+        self.move_time = (init_state.get("move_timeout", self.MOVE_TIMEOUT) *
+                          self.TIME_SHARE)
 
-    def __get_lh_dist_map(self, lh, world_map):
-        """
+        dist_maps = distfield.dist_fields(init_state["map"], self.lighthouses,
+                                          self.MAX_INT)
+        self.conn_cache = connections.ConnectionCache(self.lighthouses)
+        self.lh_dist_maps = dict(zip(self.lighthouses, dist_maps))
+        self.planner = tour.TourPlanner(self.lighthouses, dist_maps)
+        self.tri_table = triangles.TriangleTable(init_state["map"])
+        self.closing = triangles.ClosingIndex()
 
-        :param lh:
-        :param world_map:
+    def error(self, message, last_move):
+        """
+        Called when the previous move was not valid
+        :param message:
+        :param last_move:
         :return:
         """
-        lh_map = [[-1 if pos else self.MAX_INT
-                   for pos in row]
-                  for row in world_map]
-        lh_map[lh[1]][lh[0]] = 0
-        dist = 1
-        points = IronBot.__get_possible_points(lh, lh_map)
-        while len(points):
-            next_points = []
-            for x, y in points:
-                lh_map[y][x] = dist
-
-            for x, y in points:
-                cur_points = IronBot.__get_possible_points((x, y), lh_map)
-                next_points.extend(cur_points)
-            points = list(set(next_points))
-            dist += 1
-
-        lh_map = [[self.MAX_INT if pos == -1 else pos
-                   for pos in row]
-                  for row in lh_map]
-
-        return lh_map
+        self.log("Recibido error: %s", message)
+        self.log("Jugada previa: %r", last_move)
 
-    @staticmethod
-    def __get_possible_points(pos, lh_map):
+    def log(self, message, *args):
         """
-
-        :param pos:
-        :param lh_map:
+        Send a message to stderr
+        :param message:
+        :param args:
         :return:
         """
-        # Random movement
-        moves = ((-1, -1), (-1, 0), (-1, 1),
-                 (0, -1), (0, 1),
-                 (1, -1), (1, 0), (1, 1))
-
-        # Possible movements
-        cx, cy = pos
-
-        points = [(cx+x, cy+y)
-                  for x, y in moves
-                  if lh_map[cy+y][cx+x] == -1]
-        return points
+        print >>sys.stderr, "[%s] %s" % (self.NAME, (message % args))
 
     def play(self, state):
         """
@@ -122,7 +102,10 @@ class IronBot(object):
         :param state:
         :return:
         """
+        deadline = time.time() + self.move_time
         lh_states = self.__get_lh_states(state)
+        self.conn_cache.update(lh_states)
+        self.closing.update(self.__own_connections(lh_states))
         my_pos = tuple(state["position"])
 
         if my_pos in lh_states:
@@ -132,7 +115,7 @@ class IronBot(object):
                     lh_states, my_pos)
                 if possible_connections:
                     conn = self.__decide_connection(
-                        possible_connections, my_pos, lh_states)
+                        possible_connections, my_pos)
 
                     return {
                         "command": "connect",
@@ -149,7 +132,7 @@ class IronBot(object):
                 }
 
         # Move
-        move = self.__decide_movement(state, lh_states)
+        move = self.__decide_movement(state, lh_states, deadline)
         return {
             "command": "move",
             "x": move[0],
@@ -178,52 +161,31 @@ class IronBot(object):
                 dists_to_lhs[tuple(_lh_states[lh]["position"])]
         return _lh_states
 
-    def __decide_connection(self, possible_connections, my_pos, lh_states):
+    def __decide_connection(self, possible_connections, my_pos):
         """
 
         :param possible_connections:
         :param my_pos:
-        :param lh_states:
         :return:
         """
-
-        for conn in possible_connections:
-            if IronBot.__closes_tri(lh_states, my_pos, conn):
-                self.log("CONNECT TRI: %s", str(conn))
-                return conn
+        gains = dict(
+            (conn, self.closing.gain(my_pos, conn, self.tri_table))
+            for conn in possible_connections
+        )
+        conn = max(possible_connections, key=gains.get)
+        if gains[conn] > 2:
+            self.log("CONNECT TRI: %s (%s)", str(conn), gains[conn])
+            return conn
         conn = random.choice(possible_connections)
         self.log("CONNECT RANDOM: %s", str(conn))
         return conn
 
-    @staticmethod
-    def __closes_tri(lh_states, orig, dest, size=False):
-        """
-
-        :param lh_states:
-        :param orig:
-        :param dest:
-        :param size:
-        :return:
-        """
-        for lh in lh_states:
-            conns = lh_states[lh]["connections"]
-            if list(orig) in conns and list(dest) in conns:
-                if size:
-                    min_0 = min(lh[0], orig[0], dest[0])
-                    max_0 = max(lh[0], orig[0], dest[0])
-                    min_1 = min(lh[1], orig[1], dest[1])
-                    max_1 = max(lh[1], orig[1], dest[1])
-                    return (max_0 - min_0) * (max_1 - min_1)
-                return True
-        if size:
-            return 0
-        return False
-
-    def __decide_movement(self, state, lh_states):
+    def __decide_movement(self, state, lh_states, deadline):
         """
 
         :param state:
         :param lh_states:
+        :param deadline:
         :return:
         """
 
@@ -234,7 +196,7 @@ class IronBot(object):
             if energy_gain > 10:
                 self.log("MOVE TO HARVEST: %s", str(move))
                 return move
-        dest_lh = self.__decide_dest_lh(state, lh_states)
+        dest_lh = self.__decide_dest_lh(state, lh_states, deadline)
         move = self.__to_lh_movement(dest_lh,
                                      state["position"],
                                      possible_moves)
@@ -284,14 +246,14 @@ class IronBot(object):
 
         return move, energy_on_move[move]
 
-    def __decide_dest_lh(self, state, lh_states):
+    def __decide_dest_lh(self, state, lh_states, deadline):
         """
 
         :param state:
         :param lh_states:
+        :param deadline:
         :return:
         """
-
         # Go to a interesting lighthouse
         for dest_lh in lh_states:
             lh_points = random.uniform(0.0, 1.0)
@@ -301,6 +263,12 @@ class IronBot(object):
                     lh_points += 1000
                 if lh_states[dest_lh]["energy"] < state["energy"]:
                     lh_points += 500
+                possible_connections = self.__get_possible_connections(
+                    lh_states, dest_lh)
+                if possible_connections:
+                    lh_points += 1000000 * max(
+                        self.closing.gain(dest_lh, conn, self.tri_table) - 2
+                        for conn in possible_connections)
             else:
                 possible_connections = self.__get_possible_connections(
                     lh_states, dest_lh)
@@ -309,8 +277,8 @@ class IronBot(object):
                     for orig_conn in possible_connections:
                         for dest_conn in lh_states[orig_conn]["connections"]:
                             if tuple(dest_conn) in possible_connections:
-                                tri_size = self.__closes_tri(
-                                    lh_states, dest_conn, orig_conn, size=True)
+                                tri_size = self.tri_table.value(
+                                    dest_lh, orig_conn, dest_conn)
                                 lh_points += 1000000 * tri_size
 
                 if lh_states[dest_lh]["energy"] < state["energy"]:
@@ -319,8 +287,62 @@ class IronBot(object):
 
         dest_lh = max(lh_states.items(),
                       key=lambda x: x[1]['points'])[0]
+
+        # Better go where the best tour starts, if one is found in time
+        planned_lh = self.__plan_tour(state, lh_states, deadline)
+        if planned_lh is not None:
+            return planned_lh
         return dest_lh
 
+    def __plan_tour(self, state, lh_states, deadline):
+        """
+        First lighthouse of the best tour, None if no tour gains anything.
+        Searches longer and wider tours until the deadline.
+        :param state:
+        :param lh_states:
+        :param deadline:
+        :return:
+        """
+        my_pos = tuple(state["position"])
+        owned = [lh for lh in lh_states
+                 if lh_states[lh]["owner"] == self.player_num]
+        keys = [lh for lh in lh_states if lh_states[lh]["have_key"]]
+        # Skip where we stand, play() already acted on it, and the
+        # lighthouses we are not strong enough to take.
+        candidates = [lh for lh in lh_states
+                      if lh != my_pos and (
+                          lh_states[lh]["owner"] == self.player_num or
+                          lh_states[lh]["energy"] < state["energy"])]
+
+        own_connections = self.__own_connections(lh_states)
+
+        best_value, best_tour = 0, []
+        for depth, width in self.PLAN_SCHEDULE:
+            if time.time() > deadline:
+                break
+            value, lh_tour = self.planner.plan(
+                my_pos, owned, keys, own_connections,
+                lambda orig, dest: not self.conn_cache.blocked(orig, dest),
+                self.tri_table.value,
+                candidates, depth=depth, width=width, deadline=deadline)
+            if value > best_value:
+                best_value, best_tour = value, lh_tour
+        if not best_tour:
+            return None
+        self.log("TOUR: %s (%s)", best_tour, best_value)
+        return best_tour[0]
+
+    def __own_connections(self, lh_states):
+        """
+        Connections between our lighthouses
+        :param lh_states:
+        :return:
+        """
+        return [(lh, tuple(dest))
+                for lh in lh_states
+                if lh_states[lh]["owner"] == self.player_num
+                for dest in lh_states[lh]["connections"]]
+
     def __get_possible_connections(self, lh_states, orig):
         """
 
@@ -337,49 +359,12 @@ class IronBot(object):
             # Do not connect if intersects
             if (dest != orig and
                     lh_states[dest]["have_key"] and
-                    list(orig) not in lh_states[dest]["connections"] and
+                    not self.conn_cache.connected(orig, dest) and
                     lh_states[dest]["owner"] == self.player_num and
-                    not IronBot.__are_lhs(orig, dest, lh_states) and
-                    not IronBot.__are_connections(lh_states, orig, dest)):
+                    not self.conn_cache.blocked(orig, dest)):
                 possible_connections.append(dest)
         return possible_connections
 
-    @staticmethod
-    def __are_lhs(orig, dest, lh_states):
-        """
-
-        :param orig:
-        :param dest:
-        :param lh_states:
-        :return:
-        """
-        x0, x1 = sorted((orig[0], dest[0]))
-        y0, y1 = sorted((orig[1], dest[1]))
-        for lh in lh_states:
-            if (x0 <= lh[0] <= x1 and y0 <= lh[1] <= y1 and
-                    lh not in (orig, dest) and
-                    IronBot.colinear(orig, dest, lh)):
-                return True
-        return False
-
-    @staticmethod
-    def __are_connections(lh_states, orig, dest):
-        """
-
-        :param lh_states:
-        :param orig:
-        :param dest:
-        :return:
-        """
-        for lh in lh_states:
-            for c in lh_states[lh]["connections"]:
-                if IronBot.intersect(
-                        (lh_states[lh]["position"], tuple(c)),
-                        (orig, dest)
-                    ):
-                    return True
-        return False
-
     def __to_lh_movement(self, lh, my_pos, possible_moves):
         """
 
@@ -418,46 +403,7 @@ class IronBot(object):
         sys.stdout.write(json.dumps(msg) + "\n")
         sys.stdout.flush()
 
-    @staticmethod
-    def orient2d(a, b, c):
-        """
-
-        :param a:
-        :param b:
-        :param c:
-        :return:
-        """
-        return (b[0] - a[0]) * (c[1] - a[1]) - \
-            (c[0] - a[0]) * (b[1] - a[1])
-
-    @staticmethod
-    def colinear(a, b, c):
-        """
-
-        :param a:
-        :param b:
-        :param c:
-        :return:
-        """
-        return IronBot.orient2d(a, b, c) == 0
-
-    @staticmethod
-    def intersect(j, k):
-        """
-
-        :param j:
-        :param k:
-        :return:
-        """
-        j1, j2 = j
-        k1, k2 = k
-        return (
-            IronBot.orient2d(k1, k2, j1) *
-            IronBot.orient2d(k1, k2, j2) < 0 and
-            IronBot.orient2d(j1, j2, k1) *
-            IronBot.orient2d(j1, j2, k2) < 0
-        )
-
 if __name__ == "__main__":
+    seeding.seed_from_env()
     bot = IronBot()
     bot.run()